@@ -1 +1,15 @@
- 
\ No newline at end of file
+import os
+
+ENV_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
+
+
+def load_env_file(path=ENV_FILE):
+    """Load ``.env`` into the environment without overriding set variables.
+
+    Settings are read when the ``api`` modules are imported, so entry points
+    call this first. python-dotenv is only imported when the file exists.
+    """
+    if os.path.exists(path):
+        from dotenv import load_dotenv
+
+        load_dotenv(path)
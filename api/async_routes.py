@@ -0,0 +1,339 @@
+import asyncio
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Literal, Optional
+from . import (
+    models, schemas, auth, export, hashing, purge, results, rollups, search, serialization,
+    sharding,
+)
+from .database import get_async_db, get_async_read_db
+from .journal import VoteJournal, get_vote_journal
+from .pagination import decode_id_cursor, decode_rank_cursor, encode_cursor
+from .ratelimit import limit_writes_async
+from .sharding import get_poll_async_db, get_poll_async_read_db
+from .votes import VoteWriter, apply_vote_batch, get_vote_writer, record_vote
+from datetime import datetime, timedelta
+
+# Async twins of the routes in api/routes.py, served when POLLY_DB_MODE=async.
+# Both routers expose the same paths and payloads so they can be benchmarked
+# against each other; shared write logic runs through AsyncSession.run_sync.
+
+router = APIRouter()
+
+
+async def _get_poll_with_options(db: AsyncSession, poll_id: int):
+    result = await db.execute(
+        select(models.Poll)
+        .options(selectinload(models.Poll.options))
+        .where(models.Poll.id == poll_id)
+    )
+    return result.scalars().first()
+
+
+@router.post("/register", response_model=schemas.UserOut)
+async def register(
+    user: schemas.UserCreate,
+    db: AsyncSession = Depends(get_async_db),
+    read_db: AsyncSession = Depends(get_async_read_db),
+):
+    # Look up and hash without holding the writer connection
+    db_user = await auth.get_user_async(read_db, user.username)
+    if db_user:
+        raise HTTPException(status_code=400, detail="Username already registered")
+    hashed_password = await hashing.hash_password_async(user.password)
+    new_user = models.User(username=user.username, hashed_password=hashed_password)
+    db.add(new_user)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Username already registered")
+    return new_user
+
+
+@router.post("/login", response_model=schemas.Token)
+async def login(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+    read_db: AsyncSession = Depends(get_async_read_db),
+):
+    # Verify against a reader; the writer is only used to store a rehash
+    user = await auth.authenticate_user_async(
+        read_db, form_data.username, form_data.password, write_db=db
+    )
+    if not user:
+        raise HTTPException(status_code=400, detail="Incorrect username or password")
+    access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = auth.create_access_token(
+        data={"sub": user.username}, expires_delta=access_token_expires
+    )
+    return {"access_token": access_token, "token_type": "bearer"}
+
+
+@router.get("/polls", response_model=List[schemas.PollOut])
+async def get_polls(
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    after_id = decode_id_cursor(after) if after is not None else None
+    if serialization.FAST_JSON:
+        polls = await db.run_sync(serialization.list_polls, skip, limit, after_id)
+        page = response = serialization.FastJSONResponse(polls)
+        last_id = polls[-1]["id"] if polls else None
+    else:
+        query = (
+            select(models.Poll)
+            .options(selectinload(models.Poll.options))
+            .order_by(models.Poll.id)
+        )
+        if after_id is not None:
+            query = query.where(models.Poll.id > after_id)
+        else:
+            query = query.offset(skip)
+        page = polls = (await db.execute(query.limit(limit))).scalars().all()
+        last_id = polls[-1].id if polls else None
+    if limit > 0 and len(polls) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor({"id": last_id})
+    return page
+
+
+# Declared before /polls/{poll_id} so "results" is not taken for a poll id
+@router.get("/polls/results")
+async def get_batch_results(
+    ids: str,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    poll_ids = results.parse_ids(ids)
+    # load_many probes the cache once per poll; only misses touch the database
+    entries = await db.run_sync(results.load_many, poll_ids, if_none_match)
+    return results.to_response(results.batch_entry(poll_ids, entries), if_none_match)
+
+
+# Declared before /polls/{poll_id} so "search" is not taken for a poll id
+@router.get("/polls/search", response_model=List[schemas.PollOut])
+async def search_polls(
+    response: Response,
+    q: str,
+    limit: int = 10,
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    match = search.match_expression(q)
+    if match is None:
+        raise HTTPException(status_code=400, detail="Search query must contain a word")
+    seek = decode_rank_cursor(after) if after is not None else None
+    hits = await db.run_sync(search.search_poll_ids, match, limit, seek)
+    if limit > 0 and len(hits) == limit:
+        last_id, rank = hits[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor({"rank": rank, "id": last_id})
+    return await db.run_sync(search.load_polls, [poll_id for poll_id, _ in hits])
+
+
+@router.get("/polls/{poll_id}", response_model=schemas.PollOut)
+async def get_poll(poll_id: int, db: AsyncSession = Depends(get_async_read_db)):
+    if serialization.FAST_JSON:
+        poll = await db.run_sync(serialization.get_poll, poll_id)
+        if not poll:
+            raise HTTPException(status_code=404, detail="Poll not found")
+        return serialization.FastJSONResponse(poll)
+    poll = await _get_poll_with_options(db, poll_id)
+    if not poll:
+        raise HTTPException(status_code=404, detail="Poll not found")
+    return poll
+
+
+def _vote_accepted(user_id: int, poll_id: int, option_id: int):
+    return JSONResponse(
+        status_code=202,
+        content={
+            "status": "accepted",
+            "user_id": user_id,
+            "poll_id": poll_id,
+            "option_id": option_id,
+        },
+    )
+
+
+@router.post(
+    "/polls/{poll_id}/vote",
+    response_model=schemas.VoteOut,
+    responses={202: {"model": schemas.VoteAccepted}},
+)
+async def vote_on_poll(
+    poll_id: int,
+    vote: schemas.VoteCreate,
+    wait: bool = True,
+    db: AsyncSession = Depends(get_poll_async_db),
+    current_user: auth.Principal = Depends(limit_writes_async),
+    writer: Optional[VoteWriter] = Depends(get_vote_writer),
+    vote_journal: Optional[VoteJournal] = Depends(get_vote_journal),
+):
+    # Check if the poll exists
+    poll = await db.get(models.Poll, poll_id)
+    if not poll:
+        raise HTTPException(status_code=404, detail="Poll not found")
+
+    # Check if the option exists and belongs to the poll
+    option = (await db.execute(
+        select(models.Option.id).where(
+            models.Option.id == vote.option_id,
+            models.Option.poll_id == poll_id
+        )
+    )).first()
+    if not option:
+        raise HTTPException(status_code=404, detail="Option not found or does not belong to this poll")
+
+    if vote_journal is not None:
+        # Journal mode: append the vote; the compactor stores it in SQLite later
+        await db.rollback()
+        durable = vote_journal.append(current_user.id, poll_id, vote.option_id)
+        if wait:
+            await asyncio.wrap_future(durable)
+        return _vote_accepted(current_user.id, poll_id, vote.option_id)
+
+    if writer is not None:
+        # Group-commit mode: hand the vote to the batching writer
+        await db.rollback()
+        future = writer.submit(current_user.id, poll_id, vote.option_id)
+        if not wait:
+            return _vote_accepted(current_user.id, poll_id, vote.option_id)
+        return await asyncio.wrap_future(future)
+
+    # Insert the vote, or move the user's existing vote on this poll
+    db_vote = await db.run_sync(record_vote, current_user.id, poll_id, vote.option_id)
+    await db.commit()
+    return db_vote
+
+
+@router.post("/votes/batch", response_model=schemas.BatchVoteOut)
+async def batch_vote(
+    batch: schemas.BatchVoteCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(limit_writes_async),
+):
+    # Voting on behalf of other users is reserved for admin imports
+    if not current_user.is_admin and any(
+        item.user_id not in (None, current_user.id) for item in batch.votes
+    ):
+        raise HTTPException(
+            status_code=403, detail="Only admins can vote on behalf of other users"
+        )
+    summary = await db.run_sync(apply_vote_batch, batch.votes, current_user)
+    await db.commit()
+    return summary
+
+
+@router.get("/polls/{poll_id}/results")
+async def get_poll_results(
+    poll_id: int,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_poll_async_read_db),
+):
+    # Served from the results cache when possible; votes invalidate it. On a
+    # miss, a current If-None-Match is answered from the vote counters alone
+    cached = results.lookup(poll_id)
+    if cached is None:
+        cached = await db.run_sync(results.load, poll_id, if_none_match)
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Poll not found")
+    return results.to_response(cached, if_none_match)
+
+
+@router.get("/polls/{poll_id}/results/timeseries", response_model=schemas.TimeseriesOut)
+async def get_poll_timeseries(
+    poll_id: int,
+    bucket: Literal["minute", "hour"] = "minute",
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_poll_async_read_db),
+):
+    series = await db.run_sync(rollups.timeseries, poll_id, bucket, start, end)
+    if series is None:
+        raise HTTPException(status_code=404, detail="Poll not found")
+    return series
+
+
+@router.get("/polls/{poll_id}/votes/export")
+async def export_votes(
+    poll_id: int,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    after_id: int = 0,
+    accept_encoding: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_poll_async_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_reader_async),
+):
+    owner_id = (await db.execute(
+        select(models.Poll.owner_id).where(models.Poll.id == poll_id)
+    )).scalar()
+    if owner_id is None or owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Poll not found or not authorized")
+    compress = export.accepts_gzip(accept_encoding)
+    chunks = export.encode_chunks(db.sync_session, poll_id, format, after_id, compress=compress)
+
+    async def body():
+        # Each chunk's queries run inside run_sync, on the session's connection
+        while (data := await db.run_sync(lambda session: next(chunks, None))) is not None:
+            yield data
+
+    return StreamingResponse(
+        body(), media_type=export.FORMATS[format],
+        headers=export.headers(poll_id, format, compress),
+    )
+
+
+@router.post("/polls", response_model=schemas.PollOut)
+async def create_poll(
+    poll: schemas.PollCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(limit_writes_async),
+):
+    # Validate that at least two options are provided
+    if len(poll.options) < 2:
+        raise HTTPException(
+            status_code=400, detail="At least two options are required for a poll"
+        )
+
+    # Create the poll and its options in one transaction
+    new_poll = models.Poll(question=poll.question, owner_id=current_user.id)
+    db.add(new_poll)
+    await db.flush()
+    db.add_all(
+        models.Option(text=option_text, poll_id=new_poll.id)
+        for option_text in poll.options
+    )
+    await db.run_sync(search.index_poll, new_poll.id, poll.question, poll.options)
+    await db.commit()
+    db.expunge(new_poll)
+    created = await _get_poll_with_options(db, new_poll.id)
+    await sharding.copy_options_async(
+        created.id, [(option.id, option.poll_id, option.text) for option in created.options]
+    )
+    return created
+
+
+@router.delete("/polls/{poll_id}", status_code=204)
+async def delete_poll(
+    poll_id: int,
+    db: AsyncSession = Depends(get_poll_async_db),
+    current_user: auth.Principal = Depends(limit_writes_async),
+):
+    poll = (await db.execute(
+        select(models.Poll.id).where(
+            models.Poll.id == poll_id, models.Poll.owner_id == current_user.id
+        )
+    )).first()
+    if not poll:
+        raise HTTPException(status_code=404, detail="Poll not found or not authorized")
+    await db.run_sync(purge.delete_poll, poll_id)
+    results.mark_changed(db.sync_session, poll_id)
+    await db.commit()
+    return None
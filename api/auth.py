@@ -1,33 +1,59 @@
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+from dataclasses import dataclass
 from datetime import datetime, timedelta, UTC
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from . import hashing
+from .cache import TTLCache
 from .models import User
-from .database import get_db
+from .database import get_async_db, get_async_read_db, get_db, get_read_db
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
+import time
 
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+AUTH_CACHE_SIZE = int(os.getenv("POLLY_AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL = float(os.getenv("POLLY_AUTH_CACHE_TTL", "60"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
+# Verified token -> username, and username -> Principal. Token entries never
+# outlive the token's own ``exp``; call invalidate_user() when a user is
+# deleted or changes their password.
+token_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+principal_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user as seen by route handlers."""
+
+    id: int
+    username: str
+    is_admin: bool = False
+
+
+def invalidate_user(username: str):
+    """Forget cached credentials for ``username`` (deletion, password change)."""
+    principal_cache.pop(username)
+    token_cache.discard_where(lambda cached_username: cached_username == username)
+
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return hashing.hash_password_offloaded(password)
 
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return hashing.verify_password_offloaded(plain_password, hashed_password)[0]
 
 
+# python-jose is imported on first use to keep importing the app cheap
 def create_access_token(data: dict, expires_delta: timedelta = None):
+    from jose import jwt
+
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.now(UTC) + expires_delta
@@ -42,29 +68,130 @@ def get_user(db: Session, username: str):
     return db.query(User).filter(User.username == username).first()
 
 
-def authenticate_user(db: Session, username: str, password: str):
+def _store_rehashed_password(db: Session, user_id: int, hashed_password: str):
+    db.query(User).filter(User.id == user_id).update(
+        {User.hashed_password: hashed_password}, synchronize_session=False
+    )
+    db.commit()
+
+
+def authenticate_user(db: Session, username: str, password: str, write_db: Session = None):
+    """Check a password, transparently upgrading hashes made with an old cost.
+
+    ``db`` may be a read-only session; a rehash is written through ``write_db``
+    when one is given.
+    """
     user = get_user(db, username)
-    if not user or not verify_password(password, user.hashed_password):
+    if not user:
+        return False
+    valid, new_hash = hashing.verify_password_offloaded(password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash is not None:
+        _store_rehashed_password(write_db or db, user.id, new_hash)
     return user
 
 
-def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+async def authenticate_user_async(
+    db: AsyncSession, username: str, password: str, write_db: AsyncSession = None
 ):
-    credentials_exception = HTTPException(
+    user = await get_user_async(db, username)
+    if not user:
+        return False
+    valid, new_hash = await hashing.verify_password_async(password, user.hashed_password)
+    if not valid:
+        return False
+    if new_hash is not None:
+        await (write_db or db).run_sync(_store_rehashed_password, user.id, new_hash)
+    return user
+
+
+async def get_user_async(db: AsyncSession, username: str):
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalars().first()
+
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def username_from_token(token: str):
+    username = token_cache.get(token)
+    if username is not None:
+        return username
+    from jose import JWTError, jwt
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+    expires_at = payload.get("exp")
+    token_cache.set(
+        token, username, None if expires_at is None else expires_at - time.time()
+    )
+    return username
+
+
+def _principal(user: User):
+    principal = Principal(id=user.id, username=user.username, is_admin=user.is_admin)
+    principal_cache.set(user.username, principal)
+    return principal
+
+
+def _current_user(token: str, db: Session):
+    username = username_from_token(token)
+    principal = principal_cache.get(username)
+    if principal is not None:
+        return principal
     user = get_user(db, username=username)
     if user is None:
-        raise credentials_exception
-    return user
+        raise _credentials_exception()
+    return _principal(user)
+
+
+def get_current_user(
+    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+):
+    return _current_user(token, db)
+
+
+def get_current_reader(
+    token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)
+):
+    """``get_current_user`` for read-only routes, looking the user up on a reader.
+
+    Use it where the response outlives the handler (streaming), so a cache
+    miss never pins the single writer connection until the stream ends.
+    """
+    return _current_user(token, db)
+
+
+async def _current_user_async(token: str, db: AsyncSession):
+    username = username_from_token(token)
+    principal = principal_cache.get(username)
+    if principal is not None:
+        return principal
+    user = await get_user_async(db, username=username)
+    if user is None:
+        raise _credentials_exception()
+    return _principal(user)
+
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)
+):
+    return await _current_user_async(token, db)
+
+
+async def get_current_reader_async(
+    token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_read_db)
+):
+    """``get_current_reader`` for the async routes."""
+    return await _current_user_async(token, db)
@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe, size-bounded LRU cache whose entries expire after a TTL.
+
+    ``hits`` and ``misses`` are kept so callers can size the cache.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None, count_miss=True):
+        """Return the live entry for ``key``, or ``default``.
+
+        Pass ``count_miss=False`` for a probe that is followed by a counted
+        ``get`` on a miss, so each miss is only counted once.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                if count_miss:
+                    self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def discard_where(self, predicate):
+        """Drop every entry whose value matches ``predicate``."""
+        with self._lock:
+            stale = [key for key, (_, value) in self._data.items() if predicate(value)]
+            for key in stale:
+                del self._data[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
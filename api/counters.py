@@ -0,0 +1,65 @@
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.orm import Session
+from .models import Option, Vote
+
+
+def adjust_vote_count(db: Session, option_id: int, delta: int):
+    """Apply a vote delta to the materialized counter of an option.
+
+    Must run in the same transaction as the vote write it accounts for.
+    """
+    db.query(Option).filter(Option.id == option_id).update(
+        {Option.vote_count: Option.vote_count + delta}, synchronize_session=False
+    )
+
+
+def apply_vote_deltas(db: Session, deltas: dict):
+    """Apply ``{option_id: delta}`` to the counters with a single executemany."""
+    params = [
+        {"target_id": option_id, "delta": delta}
+        for option_id, delta in deltas.items()
+        if delta
+    ]
+    if params:
+        # Resolve the connection through the Option mapper so sharded sessions
+        # update the counters in the shard holding the option
+        db.connection(bind_arguments={"mapper": Option}).execute(
+            update(Option)
+            .where(Option.id == bindparam("target_id"))
+            .values(vote_count=Option.vote_count + bindparam("delta")),
+            params,
+        )
+
+
+def _actual_counts(db: Session):
+    return (
+        db.query(Vote.option_id, func.count(Vote.id).label("actual"))
+        .group_by(Vote.option_id)
+        .subquery()
+    )
+
+
+def verify_vote_counts(db: Session):
+    """Return ``(option_id, stored, actual)`` for every option whose counter is off."""
+    actual = _actual_counts(db)
+    actual_count = func.coalesce(actual.c.actual, 0)
+    return (
+        db.query(Option.id, Option.vote_count, actual_count)
+        .outerjoin(actual, actual.c.option_id == Option.id)
+        .filter(Option.vote_count != actual_count)
+        .order_by(Option.id)
+        .all()
+    )
+
+
+def rebuild_vote_counts(db: Session):
+    """Recompute every option counter from the ``votes`` table.
+
+    Returns the number of options that were corrected. The caller commits.
+    """
+    mismatches = verify_vote_counts(db)
+    for option_id, _, actual in mismatches:
+        db.query(Option).filter(Option.id == option_id).update(
+            {Option.vote_count: actual}, synchronize_session=False
+        )
+    return len(mismatches)
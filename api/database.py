@@ -1,11 +1,93 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./polls.db"
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# "sync" serves every route from the blocking engine below; "async" switches the
+# app to api/async_routes.py on top of the aiosqlite engine.
+DB_MODE = os.getenv("POLLY_DB_MODE", "sync")
+
+# "default" keeps SQLite's stock settings and one shared pool. "production"
+# enables WAL plus the pragmas below on every connection, serves read-only
+# routes from a pool of reader connections and funnels all writes through a
+# single writer connection, in both DB modes.
+DB_PROFILE = os.getenv("POLLY_DB_PROFILE", "default")
+READ_POOL_SIZE = int(os.getenv("POLLY_READ_POOL_SIZE", "8"))
+
+# Each pragma can be overridden with POLLY_SQLITE_<NAME>, e.g. POLLY_SQLITE_CACHE_SIZE.
+PRODUCTION_PRAGMAS = {
+    name: os.getenv(f"POLLY_SQLITE_{name.upper()}", default)
+    for name, default in {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": "-65536",  # KiB, i.e. 64 MiB
+        "mmap_size": "268435456",
+        "busy_timeout": "5000",
+        "temp_store": "MEMORY",
+    }.items()
+}
+
+
+def _set_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+    finally:
+        cursor.close()
+
+
+def apply_production_profile(engine, read_only=False):
+    """Set the production pragmas on every new connection of ``engine``."""
+    pragmas = dict(PRODUCTION_PRAGMAS)
+    if read_only:
+        pragmas["query_only"] = "ON"
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        _set_pragmas(dbapi_connection, pragmas)
+
+
+def create_engines(path):
+    """Return ``(engine, read_engine, async_engine, async_read_engine)`` for a file.
+
+    In the production profile the writers hold a single connection and the
+    readers a pool of POLLY_READ_POOL_SIZE read-only ones; otherwise each mode
+    has one engine serving both.
+    """
+    url = f"sqlite:///{path}"
+    async_url = f"sqlite+aiosqlite:///{path}"
+    connect_args = {"check_same_thread": False}
+    if DB_PROFILE != "production":
+        engine = create_engine(url, connect_args=connect_args)
+        async_engine = create_async_engine(async_url)
+        return engine, engine, async_engine, async_engine
+    engine = create_engine(url, connect_args=connect_args, pool_size=1, max_overflow=0)
+    read_engine = create_engine(
+        url, connect_args=connect_args, pool_size=READ_POOL_SIZE, max_overflow=0
+    )
+    async_engine = create_async_engine(async_url, pool_size=1, max_overflow=0)
+    async_read_engine = create_async_engine(
+        async_url, pool_size=READ_POOL_SIZE, max_overflow=0
+    )
+    apply_production_profile(engine)
+    apply_production_profile(read_engine, read_only=True)
+    apply_production_profile(async_engine.sync_engine)
+    apply_production_profile(async_read_engine.sync_engine, read_only=True)
+    return engine, read_engine, async_engine, async_read_engine
+
+
+DATABASE_PATH = os.getenv("POLLY_DATABASE_PATH", "./polls.db")
+engine, read_engine, async_engine, async_read_engine = create_engines(DATABASE_PATH)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+AsyncReadSessionLocal = async_sessionmaker(
+    bind=async_read_engine, autoflush=False, expire_on_commit=False
+)
 Base = declarative_base()
 
 
@@ -15,3 +97,23 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    """Session for read-only routes; a reader connection in the production profile."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db():
+    """``get_read_db`` for the async routes."""
+    async with AsyncReadSessionLocal() as db:
+        yield db
@@ -0,0 +1,124 @@
+import csv
+import heapq
+import io
+import os
+import zlib
+from itertools import islice
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from . import models, serialization
+
+# Raw vote export for audits. Rows are read with keyset queries and encoded
+# EXPORT_CHUNK at a time, so memory stays flat whatever the size of the poll.
+# Each option's votes are read in id order through ix_votes_option_id and the
+# per-option streams are merged, which yields the poll's votes in id order
+# without an index on votes.poll_id (one more index to maintain on every vote
+# write). The option streams share the chunk: each pages by
+# EXPORT_CHUNK // options rows, so at most about EXPORT_CHUNK rows are buffered
+# however many options the poll has. Votes still waiting in the journal are not
+# exported.
+EXPORT_CHUNK = int(os.getenv("POLLY_EXPORT_CHUNK", "5000"))
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+COLUMNS = ("id", "user_id", "option_id", "created_at")
+
+
+def _option_votes(db: Session, option_id: int, after_id: int, chunk: int):
+    while True:
+        rows = db.execute(
+            select(models.Vote.id, models.Vote.user_id, models.Vote.option_id,
+                   models.Vote.created_at)
+            .where(models.Vote.option_id == option_id, models.Vote.id > after_id)
+            .order_by(models.Vote.id)
+            .limit(chunk)
+        ).all()
+        yield from rows
+        if len(rows) < chunk:
+            return
+        after_id = rows[-1][0]
+
+
+def iter_votes(db: Session, poll_id: int, after_id: int = 0, chunk: int = EXPORT_CHUNK):
+    """Yield the poll's votes as ``(id, user_id, option_id, created_at)``, by id.
+
+    Only votes with an id above ``after_id`` are returned, so an interrupted
+    export resumes from the last id it received.
+    """
+    option_ids = [
+        option_id for (option_id,) in
+        db.query(models.Option.id).filter(models.Option.poll_id == poll_id)
+    ]
+    page = max(1, chunk // max(1, len(option_ids)))
+    return heapq.merge(*(_option_votes(db, option_id, after_id, page)
+                         for option_id in option_ids))
+
+
+def _ndjson(rows):
+    return b"".join(
+        serialization.dumps(dict(zip(COLUMNS, row))) + b"\n" for row in rows
+    )
+
+
+def _csv(rows, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(COLUMNS)
+    writer.writerows(
+        (vote_id, user_id, option_id, created_at.isoformat() if created_at else "")
+        for vote_id, user_id, option_id, created_at in rows
+    )
+    return buffer.getvalue().encode()
+
+
+def encode_chunks(db: Session, poll_id: int, format: str, after_id: int = 0,
+                  chunk: int = EXPORT_CHUNK, compress: bool = False):
+    """Yield the export as byte chunks of up to ``chunk`` votes each.
+
+    CSV starts with a header row. With ``compress`` the chunks form a single
+    gzip stream.
+    """
+    rows = iter_votes(db, poll_id, after_id, chunk)
+    gzip = zlib.compressobj(wbits=31) if compress else None
+    first = True
+    while True:
+        batch = list(islice(rows, chunk))
+        if not batch and not first:
+            break
+        if format == "csv":
+            data = _csv(batch, header=first)
+        else:
+            data = _ndjson(batch)
+        first = False
+        if gzip is not None:
+            data = gzip.compress(data)
+        if data:
+            yield data
+        if len(batch) < chunk:
+            break
+    if gzip is not None:
+        yield gzip.flush()
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows a gzip response."""
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            quality = params.strip().lower().removeprefix("q=")
+            try:
+                return not params or float(quality) > 0
+            except ValueError:
+                return False
+    return False
+
+
+def headers(poll_id: int, format: str, compress: bool):
+    extension = "ndjson" if format == "ndjson" else "csv"
+    result = {
+        "Content-Disposition": f'attachment; filename="poll-{poll_id}-votes.{extension}"',
+        "Vary": "Accept-Encoding",
+    }
+    if compress:
+        result["Content-Encoding"] = "gzip"
+    return result
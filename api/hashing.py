@@ -0,0 +1,115 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException, status
+
+# bcrypt only partly releases the GIL, so hashing runs in a small process pool.
+# At most HASH_WORKERS + HASH_QUEUE_DEPTH hashes may be running or waiting;
+# beyond that requests are turned away with 503 instead of piling up in the
+# request threadpool. POLLY_HASH_WORKERS=0 hashes inline.
+BCRYPT_ROUNDS = int(os.getenv("POLLY_BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("POLLY_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_DEPTH = int(os.getenv("POLLY_HASH_QUEUE_DEPTH", "16"))
+HASH_RETRY_AFTER = os.getenv("POLLY_HASH_RETRY_AFTER", "1")
+
+_pwd_context = None
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(HASH_WORKERS, 1) + HASH_QUEUE_DEPTH)
+
+
+def pwd_context():
+    """The bcrypt context, built on first use in each process."""
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+
+        _pwd_context = CryptContext(
+            schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS
+        )
+    return _pwd_context
+
+
+def hash_password(password):
+    return pwd_context().hash(password)
+
+
+def verify_and_rehash(password, hashed_password):
+    """Return ``(valid, new_hash)``; ``new_hash`` is set when the cost is outdated."""
+    context = pwd_context()
+    if not context.verify(password, hashed_password):
+        return False, None
+    if context.needs_update(hashed_password):
+        return True, context.hash(password)
+    return True, None
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # The pool starts lazily, when the journal, vote writer and purger
+            # threads may already run; forking a threaded process can deadlock
+            # the child, so workers come from a fork server (spawn elsewhere)
+            method = (
+                "forkserver"
+                if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            )
+            _pool = ProcessPoolExecutor(
+                max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context(method)
+            )
+        return _pool
+
+
+def _submit(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many password operations in progress, try again shortly",
+            headers={"Retry-After": HASH_RETRY_AFTER},
+        )
+    try:
+        future = _get_pool().submit(fn, *args)
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def _run(fn, *args):
+    if HASH_WORKERS <= 0:
+        return fn(*args)
+    return _submit(fn, *args).result()
+
+
+async def _run_async(fn, *args):
+    if HASH_WORKERS <= 0:
+        return await asyncio.to_thread(fn, *args)
+    return await asyncio.wrap_future(_submit(fn, *args))
+
+
+def hash_password_offloaded(password):
+    return _run(hash_password, password)
+
+
+def verify_password_offloaded(password, hashed_password):
+    return _run(verify_and_rehash, password, hashed_password)
+
+
+async def hash_password_async(password):
+    return await _run_async(hash_password, password)
+
+
+async def verify_password_async(password, hashed_password):
+    return await _run_async(verify_and_rehash, password, hashed_password)
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
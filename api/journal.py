@@ -0,0 +1,316 @@
+import glob
+import mmap
+import os
+import struct
+import threading
+import zlib
+from concurrent.futures import Future
+from datetime import datetime, UTC
+from . import models, results, sharding
+from .votes import record_votes
+
+# Journal mode (POLLY_VOTE_JOURNAL=1) accepts a vote by appending a fixed-width
+# record to a memory-mapped segment file instead of writing SQLite. Segments
+# are msync'ed every POLLY_JOURNAL_FSYNC_MS milliseconds; a vote is durable, and
+# a waiting request answered, after the first sync that covers it. A compactor
+# thread folds the records into the votes table and counters every
+# POLLY_JOURNAL_COMPACT_MS milliseconds, storing how far it got in the
+# journal_checkpoint table in the same transaction, and deletes segments once
+# they are fully folded. On startup every record past the checkpoint is
+# replayed. Until a vote is compacted, results merge it in (see
+# results.set_pending_source), so reads stay accurate while compaction lags.
+JOURNAL = os.getenv("POLLY_VOTE_JOURNAL", "0") == "1"
+JOURNAL_DIR = os.getenv("POLLY_JOURNAL_DIR", "./journal")
+JOURNAL_SEGMENT_RECORDS = int(os.getenv("POLLY_JOURNAL_SEGMENT_RECORDS", "65536"))
+JOURNAL_FSYNC_MS = int(os.getenv("POLLY_JOURNAL_FSYNC_MS", "20"))
+JOURNAL_COMPACT_MS = int(os.getenv("POLLY_JOURNAL_COMPACT_MS", "500"))
+JOURNAL_COMPACT_BATCH = int(os.getenv("POLLY_JOURNAL_COMPACT_BATCH", "5000"))
+
+# user_id, poll_id, option_id and the time the vote was cast, followed by a
+# CRC32 of those 32 bytes. A record that was never written (zeros) or torn by a
+# crash fails the check and ends the segment.
+_BODY = struct.Struct("<qqqd")
+RECORD = struct.Struct("<32sI4x")
+
+
+class Segment:
+    """A preallocated, memory-mapped file of ``capacity`` journal records."""
+
+    def __init__(self, path: str, sequence: int, capacity: int = None):
+        self.path = path
+        self.sequence = sequence
+        # With a capacity the file is created; otherwise an existing one is opened
+        with open(path, "w+b" if capacity else "r+b") as file:
+            if capacity:
+                file.truncate(capacity * RECORD.size)
+                os.fsync(file.fileno())
+            self._map = mmap.mmap(file.fileno(), 0)
+        self.capacity = len(self._map) // RECORD.size
+        self.count = 0
+        self._lock = threading.Lock()
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    def append(self, user_id, poll_id, option_id, cast_at):
+        body = _BODY.pack(user_id, poll_id, option_id, cast_at)
+        offset = self.count * RECORD.size
+        self._map[offset:offset + RECORD.size] = RECORD.pack(body, zlib.crc32(body))
+        self.count += 1
+        return self.count - 1
+
+    def read(self):
+        """Yield the valid records from the start of the segment, setting ``count``."""
+        self.count = 0
+        for offset in range(0, self.capacity * RECORD.size, RECORD.size):
+            body, checksum = RECORD.unpack_from(self._map, offset)
+            if zlib.crc32(body) != checksum:
+                break
+            self.count += 1
+            yield _BODY.unpack(body)
+
+    def sync(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.flush()
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.flush()
+                self._map.close()
+                self._map = None
+
+
+class VoteJournal:
+    def __init__(self, session_factory, directory=JOURNAL_DIR,
+                 segment_records=JOURNAL_SEGMENT_RECORDS, fsync_ms=JOURNAL_FSYNC_MS,
+                 compact_ms=JOURNAL_COMPACT_MS, compact_batch=JOURNAL_COMPACT_BATCH):
+        self.session_factory = session_factory
+        self.directory = directory
+        self.segment_records = segment_records
+        self.fsync_interval = fsync_ms / 1000
+        self.compact_interval = compact_ms / 1000
+        self.compact_batch = compact_batch
+        self.compactions = 0
+        self.compaction_errors = 0
+        self._current = None
+        self._sealed = []
+        # ((segment, position), user_id, poll_id, option_id, cast_at) not compacted yet
+        self._queue = []
+        # poll_id -> {user_id: ((segment, position), option_id)} for the queued votes
+        self._pending = {}
+        self._waiting = []
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def _path(self, sequence):
+        return os.path.join(self.directory, f"votes-{sequence:012d}.seg")
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        last_sequence = self._recover()
+        self._current = Segment(
+            self._path(last_sequence + 1), last_sequence + 1, self.segment_records
+        )
+        self.compact()
+        self._stopping.clear()
+        self._threads = [
+            threading.Thread(target=self._sync_loop, name="polly-journal-sync", daemon=True),
+            threading.Thread(
+                target=self._compact_loop, name="polly-journal-compactor", daemon=True
+            ),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Sync and compact everything, then release the segments."""
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._sync()
+        try:
+            while self.compact():
+                pass
+        finally:
+            with self._lock:
+                segments = self._sealed + [self._current]
+                self._sealed, self._current = [], None
+            for segment in segments:
+                segment.close()
+                # Anything left uncompacted is replayed on the next start
+                if not self._queue:
+                    os.remove(segment.path)
+
+    def _recover(self):
+        """Queue the records past the checkpoint; returns the last segment number."""
+        db = self.session_factory()
+        try:
+            checkpoint = db.get(models.JournalCheckpoint, 1)
+            resume = (checkpoint.segment, checkpoint.position) if checkpoint else (-1, 0)
+        finally:
+            db.close()
+        last_sequence = resume[0]
+        for path in sorted(glob.glob(os.path.join(self.directory, "votes-*.seg"))):
+            sequence = int(os.path.basename(path)[6:-4])
+            last_sequence = max(last_sequence, sequence)
+            if sequence < resume[0]:
+                os.remove(path)
+                continue
+            segment = Segment(path, sequence)
+            for position, record in enumerate(segment.read()):
+                if (sequence, position) >= resume:
+                    self._enqueue((sequence, position), *record)
+            self._sealed.append(segment)
+        self._drop_compacted(resume)
+        return last_sequence
+
+    def _enqueue(self, key, user_id, poll_id, option_id, cast_at):
+        self._queue.append((key, user_id, poll_id, option_id, cast_at))
+        self._pending.setdefault(poll_id, {})[user_id] = (key, option_id)
+
+    def append(self, user_id: int, poll_id: int, option_id: int) -> Future:
+        """Journal a validated vote; the future resolves once it is synced to disk."""
+        durable = Future()
+        cast_at = datetime.now(UTC).timestamp()
+        with self._lock:
+            if self._current is None:
+                raise RuntimeError("The vote journal is not running")
+            if self._current.full:
+                self._current.sync()
+                self._sealed.append(self._current)
+                sequence = self._current.sequence + 1
+                self._current = Segment(self._path(sequence), sequence, self.segment_records)
+            position = self._current.append(user_id, poll_id, option_id, cast_at)
+            self._enqueue(
+                (self._current.sequence, position), user_id, poll_id, option_id, cast_at
+            )
+            self._waiting.append(durable)
+        results.invalidate(poll_id)
+        return durable
+
+    def pending_votes(self, poll_id: int):
+        """``{user_id: option_id}`` for the poll's votes that are not compacted yet."""
+        with self._lock:
+            votes = self._pending.get(poll_id)
+            if not votes:
+                return None
+            return {user_id: option_id for user_id, (_, option_id) in votes.items()}
+
+    def pending_count(self):
+        return len(self._queue)
+
+    def _sync(self):
+        with self._lock:
+            segment, waiting, self._waiting = self._current, self._waiting, []
+        if segment is not None:
+            segment.sync()
+        for durable in waiting:
+            durable.set_result(None)
+
+    def _sync_loop(self):
+        while not self._stopping.wait(self.fsync_interval):
+            self._sync()
+
+    def _compact_loop(self):
+        while not self._stopping.wait(self.compact_interval):
+            try:
+                while self.compact() == self.compact_batch:
+                    pass
+            except Exception:
+                # The records stay queued and are retried on the next round
+                self.compaction_errors += 1
+
+    def compact(self):
+        """Fold up to ``compact_batch`` queued votes into SQLite; returns how many."""
+        with self._compact_lock:
+            with self._lock:
+                batch = self._queue[:self.compact_batch]
+            if not batch:
+                return 0
+            resume = (batch[-1][0][0], batch[-1][0][1] + 1)
+            self._fold(batch, resume)
+            with self._lock:
+                del self._queue[:len(batch)]
+                for key, user_id, poll_id, _, _ in batch:
+                    votes = self._pending.get(poll_id)
+                    if votes is not None and votes.get(user_id, (None,))[0] == key:
+                        del votes[user_id]
+                        if not votes:
+                            del self._pending[poll_id]
+                self._drop_compacted(resume)
+            self.compactions += 1
+            return len(batch)
+
+    def _fold(self, batch, resume):
+        db = self.session_factory()
+        try:
+            # With sharding each shard commits on its own and the checkpoint
+            # last; a crash in between replays votes already stored, which
+            # leaves the same final state since the last vote per user wins.
+            for poll_ids in sharding.partition(poll_id for _, _, poll_id, _, _ in batch):
+                sharding.route(db, next(iter(poll_ids)))
+                votes = [
+                    (user_id, poll_id, option_id, datetime.fromtimestamp(cast_at, UTC))
+                    for _, user_id, poll_id, option_id, cast_at in batch
+                    if poll_id in poll_ids
+                ]
+                # Votes were validated when journaled; skip polls deleted since
+                # (a poll being purged still has its options)
+                live_polls = {
+                    poll_id for (poll_id,) in
+                    db.query(models.Poll.id).filter(models.Poll.id.in_(poll_ids))
+                }
+                existing = {
+                    option_id for (option_id,) in db.query(models.Option.id).filter(
+                        models.Option.id.in_({vote[2] for vote in votes})
+                    )
+                }
+                record_votes(db, [
+                    vote for vote in votes if vote[1] in live_polls and vote[2] in existing
+                ])
+                if sharding.shards is not None:
+                    db.commit()
+            db.merge(models.JournalCheckpoint(id=1, segment=resume[0], position=resume[1]))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _drop_compacted(self, resume):
+        # Sealed segments wholly before the checkpoint are no longer needed
+        for segment in [s for s in self._sealed if (s.sequence, s.count) <= resume]:
+            self._sealed.remove(segment)
+            segment.close()
+            os.remove(segment.path)
+
+
+_journal = None
+
+
+def start_journal(session_factory, **options):
+    global _journal
+    _journal = VoteJournal(session_factory, **options)
+    _journal.start()
+    results.set_pending_source(_journal.pending_votes)
+    return _journal
+
+
+def stop_journal():
+    global _journal
+    if _journal is not None:
+        results.set_pending_source(None)
+        _journal.stop()
+        _journal = None
+
+
+def get_vote_journal():
+    """Dependency returning the running vote journal, or None."""
+    return _journal
@@ -0,0 +1,318 @@
+import threading
+import time
+from contextvars import ContextVar
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from . import auth, journal, ratelimit, results, streaming
+
+# Request and query metrics in the Prometheus text format, served at /metrics.
+# MetricsMiddleware times every request by route template; SQLAlchemy engine
+# events count and time every statement, both globally and against the request
+# that issued it, so N+1 loads show up as a jump in queries per request.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+router = APIRouter()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+            for labels, value in values
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, labels, value):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        with self._lock:
+            values = sorted(
+                (labels, (list(counts), total, count))
+                for labels, (counts, total, count) in self._values.items()
+            )
+        lines = self.header()
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                label_text = _labels(self.labelnames, labels, [("le", _number(bound))])
+                lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+            label_text = _labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_number(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+requests_total = Counter(
+    "polly_http_requests_total", "HTTP requests by route and status.",
+    ("method", "route", "status"),
+)
+request_duration = Histogram(
+    "polly_http_request_duration_seconds", "HTTP request latency.",
+    ("method", "route"),
+)
+request_queries = Histogram(
+    "polly_http_request_queries", "SQL statements executed per HTTP request.",
+    ("method", "route"), buckets=QUERY_COUNT_BUCKETS,
+)
+request_query_duration = Histogram(
+    "polly_http_request_query_seconds", "Time spent in SQL per HTTP request.",
+    ("method", "route"), buckets=QUERY_BUCKETS,
+)
+queries_total = Counter(
+    "polly_db_queries_total", "SQL statements executed.", ("statement",),
+)
+query_duration = Histogram(
+    "polly_db_query_duration_seconds", "SQL statement latency.",
+    ("statement",), buckets=QUERY_BUCKETS,
+)
+
+METRICS = [
+    requests_total,
+    request_duration,
+    request_queries,
+    request_query_duration,
+    queries_total,
+    query_duration,
+]
+
+
+class RequestStats:
+    __slots__ = ("queries", "query_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+# Set by the middleware; threadpool and run_sync calls inherit the context, so
+# statements issued on behalf of a request are charged to it.
+current_request = ContextVar("polly_current_request", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._polly_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._polly_started
+    kind = (statement.split(None, 1) or ["OTHER"])[0].upper()
+    queries_total.inc((kind,))
+    query_duration.observe((kind,), elapsed)
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_seconds += elapsed
+
+
+def _route_template(scope):
+    """The path template of the matched route, to keep label cardinality bounded."""
+    return getattr(scope.get("route"), "path", "unmatched")
+
+
+# Scopes of the requests being served. The router stores the matched route in
+# the scope, so in-flight requests are labelled when /metrics is rendered.
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def _render_in_flight():
+    counts = {}
+    with _in_flight_lock:
+        scopes = list(_in_flight.values())
+    for scope in scopes:
+        labels = (scope["method"], _route_template(scope))
+        counts[labels] = counts.get(labels, 0) + 1
+    lines = [
+        "# HELP polly_http_requests_in_flight HTTP requests currently being served.",
+        "# TYPE polly_http_requests_in_flight gauge",
+    ]
+    lines += [
+        f"polly_http_requests_in_flight{_labels(('method', 'route'), labels)} {count}"
+        for labels, count in sorted(counts.items())
+    ]
+    return lines
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and SQL work per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        stats = RequestStats()
+        token = current_request.set(stats)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        key = id(scope)
+        start = time.perf_counter()
+        with _in_flight_lock:
+            _in_flight[key] = scope
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            with _in_flight_lock:
+                del _in_flight[key]
+            current_request.reset(token)
+            labels = (scope["method"], _route_template(scope))
+            requests_total.inc(labels + (str(status),))
+            request_duration.observe(labels, elapsed)
+            request_queries.observe(labels, stats.queries)
+            request_query_duration.observe(labels, stats.query_seconds)
+
+
+def _cache_lines():
+    caches = {
+        "results": results.results_cache.stats(),
+        "auth_tokens": auth.token_cache.stats(),
+        "auth_principals": auth.principal_cache.stats(),
+    }
+    lines = []
+    for name, kind, key, documentation in (
+        ("polly_cache_hits_total", "counter", "hits", "Cache hits."),
+        ("polly_cache_misses_total", "counter", "misses", "Cache misses."),
+        ("polly_cache_entries", "gauge", "size", "Entries currently cached."),
+    ):
+        lines += [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+        lines += [
+            f'{name}{{cache="{cache}"}} {stats[key]}' for cache, stats in caches.items()
+        ]
+    broadcaster = streaming.broadcaster
+    lines += [
+        "# HELP polly_results_not_modified_total Results requests answered with 304.",
+        "# TYPE polly_results_not_modified_total counter",
+        f"polly_results_not_modified_total {results.not_modified}",
+        "# HELP polly_stream_subscribers Open results streams.",
+        "# TYPE polly_stream_subscribers gauge",
+        f"polly_stream_subscribers {broadcaster.subscriber_count()}",
+        "# HELP polly_stream_broadcasts_total Results snapshots pushed to streams.",
+        "# TYPE polly_stream_broadcasts_total counter",
+        f"polly_stream_broadcasts_total {broadcaster.broadcasts}",
+    ]
+    return lines
+
+
+def _write_guard_lines():
+    lines = [
+        "# HELP polly_writes_in_flight Writes admitted and still running.",
+        "# TYPE polly_writes_in_flight gauge",
+        f"polly_writes_in_flight {ratelimit.admission.in_flight}",
+        "# HELP polly_write_rejections_total Writes rejected by rate limits or load shedding.",
+        "# TYPE polly_write_rejections_total counter",
+    ]
+    lines += [
+        f'polly_write_rejections_total{{reason="{reason}"}} {count}'
+        for reason, count in sorted(ratelimit.rejections.items())
+    ]
+    return lines
+
+
+def _journal_lines():
+    vote_journal = journal.get_vote_journal()
+    if vote_journal is None:
+        return []
+    return [
+        "# HELP polly_journal_pending_votes Journaled votes not yet compacted into SQLite.",
+        "# TYPE polly_journal_pending_votes gauge",
+        f"polly_journal_pending_votes {vote_journal.pending_count()}",
+        "# HELP polly_journal_compactions_total Journal compaction rounds that committed.",
+        "# TYPE polly_journal_compactions_total counter",
+        f"polly_journal_compactions_total {vote_journal.compactions}",
+        "# HELP polly_journal_compaction_errors_total Journal compaction rounds that failed.",
+        "# TYPE polly_journal_compaction_errors_total counter",
+        f"polly_journal_compaction_errors_total {vote_journal.compaction_errors}",
+    ]
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    lines += _render_in_flight()
+    lines += _cache_lines()
+    lines += _write_guard_lines()
+    lines += _journal_lines()
+    return "\n".join(lines) + "\n"
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,143 @@
+import os
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+from .database import Base
+from . import counters, models, rollups, search  # noqa: F401  (models registers the tables)
+
+# The schema version lives in SQLite's ``user_version`` pragma. Every entry in
+# MIGRATIONS upgrades an existing database by one version; fresh databases are
+# created from the models and stamped with the latest version directly.
+# On startup the app only compares the version; POLLY_AUTO_MIGRATE=0 makes an
+# outdated schema a startup error instead, for deployments that migrate with
+# ``python manage.py migrate``.
+AUTO_MIGRATE = os.getenv("POLLY_AUTO_MIGRATE", "1") == "1"
+
+
+def _column_names(conn, table):
+    return {column["name"] for column in inspect(conn).get_columns(table)}
+
+
+def _add_option_vote_count(conn):
+    if "vote_count" not in _column_names(conn, "options"):
+        conn.exec_driver_sql(
+            "ALTER TABLE options ADD COLUMN vote_count INTEGER NOT NULL DEFAULT 0"
+        )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_options_poll_id ON options (poll_id)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_votes_option_id ON votes (option_id)"
+    )
+    with Session(bind=conn) as db:
+        counters.rebuild_vote_counts(db)
+        db.flush()
+
+
+def _add_user_is_admin(conn):
+    if "is_admin" not in _column_names(conn, "users"):
+        conn.exec_driver_sql(
+            "ALTER TABLE users ADD COLUMN is_admin BOOLEAN NOT NULL DEFAULT 0"
+        )
+
+
+def _add_vote_poll_id(conn):
+    if "poll_id" not in _column_names(conn, "votes"):
+        conn.exec_driver_sql(
+            "ALTER TABLE votes ADD COLUMN poll_id INTEGER REFERENCES polls (id)"
+        )
+    conn.exec_driver_sql(
+        "UPDATE votes SET poll_id = "
+        "(SELECT options.poll_id FROM options WHERE options.id = votes.option_id)"
+    )
+    # Votes whose option is gone cannot be counted; duplicates created by racing
+    # requests collapse onto the latest vote per user and poll.
+    conn.exec_driver_sql("DELETE FROM votes WHERE poll_id IS NULL")
+    conn.exec_driver_sql(
+        "DELETE FROM votes WHERE id NOT IN "
+        "(SELECT max(id) FROM votes GROUP BY user_id, poll_id)"
+    )
+    conn.exec_driver_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_votes_user_poll ON votes (user_id, poll_id)"
+    )
+    with Session(bind=conn) as db:
+        counters.rebuild_vote_counts(db)
+        db.flush()
+
+
+def _add_poll_search(conn):
+    for statement in models.POLL_SEARCH_DDL:
+        conn.exec_driver_sql(statement)
+    search.rebuild(conn)
+    # Equality lookups on free text never happen; search goes through polls_fts
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_polls_question")
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_options_text")
+
+
+def _add_journal_checkpoint(conn):
+    models.JournalCheckpoint.__table__.create(conn, checkfirst=True)
+
+
+def _add_vote_rollups(conn):
+    models.VoteRollup.__table__.create(conn, checkfirst=True)
+    # Existing votes count in the bucket they were cast in; earlier moves
+    # between options are not recorded anywhere, so they are not replayed
+    for resolution in rollups.RESOLUTIONS.values():
+        conn.exec_driver_sql(
+            "INSERT OR REPLACE INTO vote_rollups "
+            "(poll_id, resolution, bucket_start, option_id, votes) "
+            f"SELECT poll_id, {resolution}, "
+            f"CAST(strftime('%s', created_at) AS INTEGER) / {resolution} * {resolution}, "
+            "option_id, count(*) FROM votes WHERE created_at IS NOT NULL "
+            "GROUP BY 1, 2, 3, 4"
+        )
+
+
+def _add_poll_purges(conn):
+    models.PollPurge.__table__.create(conn, checkfirst=True)
+
+
+MIGRATIONS = [
+    _add_option_vote_count,
+    _add_user_is_admin,
+    _add_vote_poll_id,
+    _add_poll_search,
+    _add_journal_checkpoint,
+    _add_vote_rollups,
+    _add_poll_purges,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn):
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def upgrade(engine):
+    """Create missing tables and apply pending migrations."""
+    with engine.begin() as conn:
+        version = get_schema_version(conn)
+        fresh = not inspect(conn).has_table("users")
+        Base.metadata.create_all(bind=conn)
+        if not fresh:
+            for migration in MIGRATIONS[version:]:
+                migration(conn)
+        conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def ensure_schema(engine, auto_migrate=AUTO_MIGRATE):
+    """Make sure the database is at SCHEMA_VERSION before serving requests."""
+    with engine.connect() as conn:
+        version = get_schema_version(conn)
+    if version == SCHEMA_VERSION:
+        return
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than this code "
+            f"({SCHEMA_VERSION})"
+        )
+    if not auto_migrate:
+        raise RuntimeError(
+            f"Database schema version {version} is out of date (expected "
+            f"{SCHEMA_VERSION}); run `python manage.py migrate`"
+        )
+    upgrade(engine)
@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean
+from sqlalchemy import (
+    DDL, Column, Integer, String, ForeignKey, DateTime, Boolean, Index, event,
+)
 from sqlalchemy.orm import relationship
 from datetime import datetime, UTC
 from .database import Base
@@ -9,6 +11,7 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True)
     hashed_password = Column(String)
+    is_admin = Column(Boolean, nullable=False, default=False, server_default="0")
     polls = relationship("Poll", back_populates="owner")
     votes = relationship("Vote", back_populates="user")
 
@@ -16,27 +19,91 @@ class User(Base):
 class Poll(Base):
     __tablename__ = "polls"
     id = Column(Integer, primary_key=True, index=True)
-    question = Column(String, index=True)
+    question = Column(String)
     created_at = Column(DateTime, default=lambda: datetime.now(UTC))
     owner_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="polls")
+    # The cascades below only apply to ORM deletes of loaded objects. Polls are
+    # deleted with bulk statements (see api/purge.py), which bypass them.
     options = relationship("Option", back_populates="poll", cascade="all, delete-orphan")
 
 
+# Full-text index over each poll's question and option texts, keyed by rowid =
+# poll id and ranked with BM25 weighting the question twice as much as the
+# options. The prefix indexes on 2 and 3 characters keep search-as-you-type
+# queries from enumerating every matching term. Created and dropped along with
+# the polls table; api/search.py keeps it in sync and queries it.
+POLL_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS polls_fts USING fts5("
+    "question, options, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    "INSERT INTO polls_fts (polls_fts, rank) VALUES ('rank', 'bm25(2.0, 1.0)')",
+]
+for _statement in POLL_SEARCH_DDL:
+    event.listen(Poll.__table__, "after_create", DDL(_statement))
+event.listen(Poll.__table__, "before_drop", DDL("DROP TABLE IF EXISTS polls_fts"))
+
+
 class Option(Base):
     __tablename__ = "options"
     id = Column(Integer, primary_key=True, index=True)
-    text = Column(String, index=True)
-    poll_id = Column(Integer, ForeignKey("polls.id"))
+    text = Column(String)
+    poll_id = Column(Integer, ForeignKey("polls.id"), index=True)
+    vote_count = Column(Integer, nullable=False, default=0, server_default="0")
     poll = relationship("Poll", back_populates="options")
+    # Bypassed by the bulk poll deletes, like Poll.options
     votes = relationship("Vote", back_populates="option", cascade="all, delete-orphan")
 
 
 class Vote(Base):
     __tablename__ = "votes"
+    __table_args__ = (
+        # One vote per user per poll; also serves the upsert's conflict target
+        Index("ux_votes_user_poll", "user_id", "poll_id", unique=True),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    option_id = Column(Integer, ForeignKey("options.id"))
+    # Denormalized from the option so the per-poll uniqueness can be indexed
+    poll_id = Column(Integer, ForeignKey("polls.id"))
+    option_id = Column(Integer, ForeignKey("options.id"), index=True)
     created_at = Column(DateTime, default=lambda: datetime.now(UTC))
     user = relationship("User", back_populates="votes")
     option = relationship("Option", back_populates="votes")
+
+
+class JournalCheckpoint(Base):
+    """How far the vote journal (api/journal.py) has been folded into ``votes``.
+
+    A single row, written in the same transaction as the votes it accounts for:
+    compaction resumes after record ``position`` of segment ``segment``.
+    """
+    __tablename__ = "journal_checkpoint"
+    id = Column(Integer, primary_key=True)
+    segment = Column(Integer, nullable=False)
+    position = Column(Integer, nullable=False)
+
+
+class VoteRollup(Base):
+    """Net change of an option's vote count within one time bucket.
+
+    Maintained by record_votes (see api/rollups.py). ``resolution`` is the
+    bucket width in seconds and ``bucket_start`` a Unix timestamp; rows are
+    clustered by poll, resolution and time so a range reads contiguous rows.
+    """
+    __tablename__ = "vote_rollups"
+    __table_args__ = {"sqlite_with_rowid": False}
+    poll_id = Column(Integer, primary_key=True)
+    resolution = Column(Integer, primary_key=True)
+    bucket_start = Column(Integer, primary_key=True)
+    option_id = Column(Integer, primary_key=True)
+    votes = Column(Integer, nullable=False, default=0)
+
+
+class PollPurge(Base):
+    """A deleted poll whose options, votes and rollups are still being purged.
+
+    Large polls are removed from ``polls`` right away and queued here; the
+    purger (see api/purge.py) deletes the rest in small batches.
+    """
+    __tablename__ = "poll_purges"
+    poll_id = Column(Integer, primary_key=True)
+    deleted_at = Column(DateTime, default=lambda: datetime.now(UTC))
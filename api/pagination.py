@@ -0,0 +1,40 @@
+import base64
+import binascii
+import json
+from fastapi import HTTPException
+
+# Keyset cursors are the last row's sort key, JSON-encoded and base64url'd so
+# clients treat them as opaque tokens.
+
+
+def encode_cursor(values: dict) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError):
+        values = None
+    if not isinstance(values, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def decode_id_cursor(cursor: str) -> int:
+    last_id = decode_cursor(cursor).get("id")
+    if not isinstance(last_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return last_id
+
+
+def decode_rank_cursor(cursor: str):
+    """Decode a ``{"rank": float, "id": int}`` cursor into ``(rank, id)``."""
+    values = decode_cursor(cursor)
+    rank, last_id = values.get("rank"), values.get("id")
+    valid_rank = isinstance(rank, (int, float)) and not isinstance(rank, bool)
+    if not valid_rank or not isinstance(last_id, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return rank, last_id
@@ -0,0 +1,164 @@
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import HTTPException
+from . import auth
+from .database import ReadSessionLocal
+
+# Opt-in sampling profiler. With POLLY_PROFILING=1, ProfilingMiddleware profiles
+# requests that an admin marks with an ``X-Polly-Profile: 1`` header or a
+# ``?profile=1`` query flag, plus a random POLLY_PROFILE_SAMPLE_RATE fraction of
+# all requests. While a request runs, a sampler thread records the stacks of
+# every thread executing code from this package; each profile is written to
+# POLLY_PROFILE_DIR in the collapsed-stack format read by flamegraph.pl and
+# speedscope. Without POLLY_PROFILING the middleware is not installed at all.
+PROFILING = os.getenv("POLLY_PROFILING", "0") == "1"
+PROFILE_DIR = os.getenv("POLLY_PROFILE_DIR", "./profiles")
+PROFILE_SAMPLE_RATE = float(os.getenv("POLLY_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("POLLY_PROFILE_INTERVAL_MS", "1"))
+
+PROFILE_HEADER = "x-polly-profile"
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_ROOT_DIR = os.path.dirname(_APP_DIR)
+_APP_PREFIX = _APP_DIR + os.sep
+
+
+def _frame_label(code):
+    filename = code.co_filename
+    if filename.startswith(_ROOT_DIR + os.sep):
+        filename = os.path.relpath(filename, _ROOT_DIR)
+    else:
+        filename = os.path.basename(filename)
+    return f"{filename}:{code.co_qualname}"
+
+
+class StackSampler:
+    """Samples the stacks of threads running this package's code until stopped.
+
+    Threads idle in the server, the threadpool or the event loop have no frame
+    from ``api/`` on their stack and are skipped. Stacks of other requests being
+    served at the same time are included too.
+    """
+
+    def __init__(self, interval_ms=PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="polly-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                labels = []
+                in_app = False
+                while frame is not None:
+                    code = frame.f_code
+                    in_app = in_app or code.co_filename.startswith(_APP_PREFIX)
+                    labels.append(_frame_label(code))
+                    frame = frame.f_back
+                if not in_app:
+                    continue
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                labels.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(labels))] += 1
+
+    def collapsed(self):
+        """The samples as ``frame;frame;... count`` lines, root frame first."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _wants_profile(scope, headers):
+    if headers.get(PROFILE_HEADER.encode()) == b"1":
+        return True
+    query = scope.get("query_string", b"").split(b"&")
+    return b"profile=1" in query
+
+
+class ProfilingMiddleware:
+    """Profile flagged (admin only) or randomly sampled requests."""
+
+    def __init__(self, app, session_factory=ReadSessionLocal, directory=PROFILE_DIR,
+                 sample_rate=PROFILE_SAMPLE_RATE, interval_ms=PROFILE_INTERVAL_MS):
+        self.app = app
+        self.session_factory = session_factory
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.interval_ms = interval_ms
+
+    def _lookup_admin(self, username):
+        db = self.session_factory()
+        try:
+            user = auth.get_user(db, username)
+            return user is not None and user.is_admin
+        finally:
+            db.close()
+
+    async def _is_admin(self, headers):
+        scheme, _, token = headers.get(b"authorization", b"").decode().partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return False
+        try:
+            username = auth.username_from_token(token)
+        except HTTPException:
+            return False
+        principal = auth.principal_cache.get(username)
+        if principal is not None:
+            return principal.is_admin
+        return await run_in_threadpool(self._lookup_admin, username)
+
+    async def _should_profile(self, scope):
+        headers = dict(scope["headers"])
+        if _wants_profile(scope, headers):
+            return await self._is_admin(headers)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not await self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        filename = "{}-{}-{}.folded".format(
+            time.strftime("%Y%m%dT%H%M%S"), scope["method"].lower(), uuid.uuid4().hex[:8]
+        )
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-polly-profile", filename.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        sampler = StackSampler(self.interval_ms)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            await run_in_threadpool(self._write, filename, sampler.collapsed())
+
+    def _write(self, filename, content):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, filename), "w") as fh:
+            fh.write(content)
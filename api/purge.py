@@ -0,0 +1,176 @@
+import os
+import threading
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from . import counters, models, rollups, search, sharding
+
+# Polls are deleted with set-based DELETE statements rather than through the
+# ORM cascade, which would load every option and vote into memory first. Polls
+# with more than POLLY_PURGE_THRESHOLD votes are only tombstoned by the request:
+# the poll row goes at once, so the poll disappears from every read, and a
+# poll_purges row hands its options, votes and rollups to the purger. The purger
+# deletes POLLY_PURGE_BATCH votes per transaction and pauses between batches,
+# so other writers get the write lock in between. A negative threshold always
+# deletes inline.
+PURGE_THRESHOLD = int(os.getenv("POLLY_PURGE_THRESHOLD", "50000"))
+PURGE_BATCH = int(os.getenv("POLLY_PURGE_BATCH", "5000"))
+PURGE_INTERVAL_MS = int(os.getenv("POLLY_PURGE_INTERVAL_MS", "1000"))
+PURGE_PAUSE_MS = int(os.getenv("POLLY_PURGE_PAUSE_MS", "10"))
+
+_BULK = {"synchronize_session": False}
+
+
+def _vote_total(db: Session, poll_id: int) -> int:
+    # The materialized counters make this an index range scan over the options
+    return db.query(func.coalesce(func.sum(models.Option.vote_count), 0)).filter(
+        models.Option.poll_id == poll_id
+    ).scalar()
+
+
+def delete_poll(db: Session, poll_id: int, threshold: int = None) -> bool:
+    """Delete a poll and everything under it; returns True if the purge is deferred.
+
+    ``db`` must be routed to the poll (see sharding.route). The caller commits.
+    """
+    if threshold is None:
+        threshold = PURGE_THRESHOLD
+    db.execute(delete(models.Poll).where(models.Poll.id == poll_id), execution_options=_BULK)
+    search.unindex_poll(db, poll_id)
+    sharding.delete_main_options(db, poll_id)
+    if threshold >= 0 and _vote_total(db, poll_id) > threshold:
+        db.merge(models.PollPurge(poll_id=poll_id))
+        return True
+    option_ids = select(models.Option.id).where(models.Option.poll_id == poll_id)
+    db.execute(
+        delete(models.Vote).where(models.Vote.option_id.in_(option_ids)),
+        execution_options=_BULK,
+    )
+    rollups.delete_poll_rollups(db, poll_id)
+    db.execute(
+        delete(models.Option).where(models.Option.poll_id == poll_id), execution_options=_BULK
+    )
+    return False
+
+
+def purge_batch(db: Session, poll_id: int, limit: int = PURGE_BATCH) -> bool:
+    """Delete up to ``limit`` votes of a tombstoned poll; True once it is fully purged.
+
+    Votes go one option at a time, with the option's counter decremented in
+    step so the counters stay verifiable; an option is deleted with its last
+    votes. The rollups and the tombstone go last. The caller commits.
+    """
+    sharding.route(db, poll_id)
+    # Touch the main database before the shard, as every other writer does:
+    # with a single writer connection each, the other order could deadlock
+    if db.get(models.PollPurge, poll_id) is None:
+        return True
+    option_id = (
+        db.query(models.Option.id)
+        .filter(models.Option.poll_id == poll_id)
+        .order_by(models.Option.id)
+        .limit(1)
+        .scalar()
+    )
+    if option_id is None:
+        rollups.delete_poll_rollups(db, poll_id)
+        db.execute(
+            delete(models.PollPurge).where(models.PollPurge.poll_id == poll_id),
+            execution_options=_BULK,
+        )
+        return True
+    chunk = (
+        select(models.Vote.id).where(models.Vote.option_id == option_id).limit(limit)
+    ).scalar_subquery()
+    deleted = db.execute(
+        delete(models.Vote).where(models.Vote.id.in_(chunk)), execution_options=_BULK
+    ).rowcount
+    if deleted < limit:
+        db.execute(
+            delete(models.Option).where(models.Option.id == option_id), execution_options=_BULK
+        )
+    else:
+        counters.adjust_vote_count(db, option_id, -deleted)
+    return False
+
+
+class Purger:
+    """Background thread that purges the polls queued in ``poll_purges``."""
+
+    def __init__(self, session_factory, interval_ms=PURGE_INTERVAL_MS, batch=PURGE_BATCH,
+                 pause_ms=PURGE_PAUSE_MS):
+        self.session_factory = session_factory
+        self.interval = interval_ms / 1000
+        self.batch = batch
+        self.pause = pause_ms / 1000
+        self.purged = 0
+        self.errors = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="polly-purger", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop after the current batch; unfinished purges resume on the next start."""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.purge_pending()
+            except Exception:
+                # The tombstones stay queued and are retried on the next round
+                self.errors += 1
+
+    def pending(self):
+        db = self.session_factory()
+        try:
+            return [
+                poll_id for (poll_id,) in
+                db.query(models.PollPurge.poll_id).order_by(models.PollPurge.poll_id)
+            ]
+        finally:
+            db.close()
+
+    def purge_pending(self):
+        """Purge every queued poll, one committed batch at a time; returns how many."""
+        purged = 0
+        for poll_id in self.pending():
+            db = self.session_factory()
+            try:
+                while not purge_batch(db, poll_id, self.batch):
+                    db.commit()
+                    if self._stopping.wait(self.pause):
+                        return purged
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+            purged += 1
+            self.purged += 1
+        return purged
+
+
+_purger = None
+
+
+def start_purger(session_factory, **options):
+    global _purger
+    _purger = Purger(session_factory, **options)
+    _purger.start()
+    return _purger
+
+
+def stop_purger():
+    global _purger
+    if _purger is not None:
+        _purger.stop()
+        _purger = None
@@ -0,0 +1,186 @@
+import math
+import os
+import threading
+import time
+from collections import Counter, deque
+from fastapi import Depends, HTTPException, status
+from . import auth
+from .cache import TTLCache
+
+# Write routes (create/delete poll, vote, batch vote) pass through two guards
+# keyed off the authenticated user:
+#
+# * token buckets per user and for the whole service, refilled at
+#   POLLY_USER_WRITE_RATE / POLLY_GLOBAL_WRITE_RATE writes per second up to the
+#   matching *_BURST; an empty bucket answers 429. A rate of 0 disables it.
+# * an admission controller that answers 503 while POLLY_MAX_WRITES_IN_FLIGHT
+#   writes are already running, or while the p99 latency of the writes that
+#   finished in the last POLLY_WRITE_LATENCY_WINDOW seconds is above
+#   POLLY_WRITE_P99_MS (0 disables the latency check).
+#
+# Rejected writes fail fast with Retry-After instead of queueing behind the
+# single SQLite writer, which keeps read latency stable under a write storm.
+USER_WRITE_RATE = float(os.getenv("POLLY_USER_WRITE_RATE", "0"))
+USER_WRITE_BURST = float(os.getenv("POLLY_USER_WRITE_BURST", "20"))
+GLOBAL_WRITE_RATE = float(os.getenv("POLLY_GLOBAL_WRITE_RATE", "0"))
+GLOBAL_WRITE_BURST = float(os.getenv("POLLY_GLOBAL_WRITE_BURST", "200"))
+MAX_WRITES_IN_FLIGHT = int(os.getenv("POLLY_MAX_WRITES_IN_FLIGHT", "64"))
+WRITE_P99_MS = float(os.getenv("POLLY_WRITE_P99_MS", "0"))
+WRITE_LATENCY_WINDOW = float(os.getenv("POLLY_WRITE_LATENCY_WINDOW", "10"))
+OVERLOAD_RETRY_AFTER = os.getenv("POLLY_OVERLOAD_RETRY_AFTER", "1")
+RATE_LIMIT_USERS = int(os.getenv("POLLY_RATE_LIMIT_USERS", "10000"))
+
+# Rejected writes by reason, exported at /metrics
+rejections = Counter()
+
+
+def _reject(status_code, reason, detail, retry_after):
+    rejections[reason] += 1
+    raise HTTPException(
+        status_code=status_code, detail=detail, headers={"Retry-After": retry_after}
+    )
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Take a token; returns 0 on success, else seconds until one is available."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+class WriteRateLimiter:
+    """Per-user and global token buckets for write routes."""
+
+    def __init__(self, user_rate=USER_WRITE_RATE, user_burst=USER_WRITE_BURST,
+                 global_rate=GLOBAL_WRITE_RATE, global_burst=GLOBAL_WRITE_BURST,
+                 max_users=RATE_LIMIT_USERS):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        # A bucket left alone for burst / rate seconds is full again, so
+        # forgetting it then (or when evicted) changes nothing.
+        refill_seconds = user_burst / user_rate if user_rate > 0 else 1
+        self._users = TTLCache(max_users, max(refill_seconds, 1))
+        self._users_lock = threading.Lock()
+        self._global = TokenBucket(global_rate, global_burst) if global_rate > 0 else None
+
+    def _user_bucket(self, user_id):
+        with self._users_lock:
+            bucket = self._users.get(user_id)
+            if bucket is None:
+                bucket = TokenBucket(self.user_rate, self.user_burst)
+            self._users.set(user_id, bucket)
+            return bucket
+
+    def check(self, user_id: int):
+        """Raise 429 if the user or the whole service is over its write rate."""
+        if self.user_rate > 0:
+            wait = self._user_bucket(user_id).take()
+            if wait:
+                _reject(
+                    status.HTTP_429_TOO_MANY_REQUESTS, "user_rate",
+                    "Too many writes, slow down", str(math.ceil(wait)),
+                )
+        if self._global is not None:
+            wait = self._global.take()
+            if wait:
+                _reject(
+                    status.HTTP_429_TOO_MANY_REQUESTS, "global_rate",
+                    "Service is receiving too many writes, try again shortly",
+                    str(math.ceil(wait)),
+                )
+
+
+class AdmissionController:
+    """Sheds writes by concurrency and by recently observed p99 latency."""
+
+    def __init__(self, max_in_flight=MAX_WRITES_IN_FLIGHT, p99_ms=WRITE_P99_MS,
+                 window_seconds=WRITE_LATENCY_WINDOW, retry_after=OVERLOAD_RETRY_AFTER,
+                 min_samples=20, refresh_seconds=0.5):
+        self.max_in_flight = max_in_flight
+        self.p99 = p99_ms / 1000
+        self.window = window_seconds
+        self.retry_after = retry_after
+        self.min_samples = min_samples
+        self.refresh = refresh_seconds
+        self.in_flight = 0
+        self._latencies = deque(maxlen=2000)
+        self._observed_p99 = 0.0
+        self._observed_at = 0.0
+        self._lock = threading.Lock()
+
+    def _current_p99(self, now):
+        # Recomputed at most every ``refresh`` seconds; old samples age out so
+        # shedding stops once the window no longer holds slow writes.
+        if now - self._observed_at >= self.refresh:
+            while self._latencies and self._latencies[0][0] < now - self.window:
+                self._latencies.popleft()
+            if len(self._latencies) < self.min_samples:
+                self._observed_p99 = 0.0
+            else:
+                ordered = sorted(latency for _, latency in self._latencies)
+                self._observed_p99 = ordered[math.ceil(len(ordered) * 0.99) - 1]
+            self._observed_at = now
+        return self._observed_p99
+
+    def enter(self):
+        """Admit a write or raise 503."""
+        with self._lock:
+            if self.max_in_flight > 0 and self.in_flight >= self.max_in_flight:
+                _reject(
+                    status.HTTP_503_SERVICE_UNAVAILABLE, "queue_depth",
+                    "Too many writes in progress, try again shortly", self.retry_after,
+                )
+            if self.p99 > 0 and self._current_p99(time.monotonic()) > self.p99:
+                _reject(
+                    status.HTTP_503_SERVICE_UNAVAILABLE, "latency",
+                    "Writes are slow right now, try again shortly", self.retry_after,
+                )
+            self.in_flight += 1
+
+    def exit(self, elapsed: float):
+        with self._lock:
+            self.in_flight -= 1
+            if self.p99 > 0:
+                self._latencies.append((time.monotonic(), elapsed))
+
+
+limiter = WriteRateLimiter()
+admission = AdmissionController()
+
+
+def _guarded(current_user):
+    limiter.check(current_user.id)
+    admission.enter()
+    return time.perf_counter()
+
+
+def limit_writes(current_user: auth.Principal = Depends(auth.get_current_user)):
+    """Dependency for write routes: rate limits, then admission control."""
+    started = _guarded(current_user)
+    try:
+        yield current_user
+    finally:
+        admission.exit(time.perf_counter() - started)
+
+
+async def limit_writes_async(
+    current_user: auth.Principal = Depends(auth.get_current_user_async),
+):
+    started = _guarded(current_user)
+    try:
+        yield current_user
+    finally:
+        admission.exit(time.perf_counter() - started)
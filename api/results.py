@@ -0,0 +1,327 @@
+import hashlib
+import json
+import os
+import threading
+from typing import NamedTuple, Optional
+from fastapi import HTTPException, Response
+from sqlalchemy import event, literal
+from sqlalchemy.orm import Session
+from . import models, sharding
+from .cache import TTLCache
+
+# Serialized poll results keyed by poll_id. Entries are dropped when a vote or
+# delete on the poll commits (see mark_changed); the TTL only bounds staleness
+# caused by writes handled in other worker processes.
+RESULTS_CACHE_SIZE = int(os.getenv("POLLY_RESULTS_CACHE_SIZE", "4096"))
+RESULTS_CACHE_TTL = float(os.getenv("POLLY_RESULTS_CACHE_TTL", "5"))
+# Most polls one GET /polls/results request may ask for
+BATCH_RESULTS_MAX = int(os.getenv("POLLY_BATCH_RESULTS_MAX", "100"))
+
+results_cache = TTLCache(RESULTS_CACHE_SIZE, RESULTS_CACHE_TTL)
+not_modified = 0
+
+# Bumped on every invalidation so a read that raced with a commit does not put
+# stale results back into the cache. Striped to keep memory bounded.
+_GENERATION_STRIPES = 1024
+_generations = [0] * _GENERATION_STRIPES
+_generations_lock = threading.Lock()
+
+# Callables notified with the poll_id after its results changed (see add_listener).
+_listeners = []
+
+# Returns ``{user_id: option_id}`` for votes on a poll that were accepted but are
+# not in the votes table yet (see api/journal.py), or None; results merge them in.
+_pending_source = None
+
+_PENDING_CHUNK_SIZE = 500
+
+
+class CachedResults(NamedTuple):
+    etag: str
+    # None when only the ETag was read, to answer a conditional request
+    body: Optional[bytes]
+
+
+def compute_results(db: Session, poll_id: int):
+    """Build the results payload for a poll, or None if it does not exist."""
+    # Taken before reading the tables: a vote compacted in between is then seen
+    # in both places, which merging tolerates, rather than in neither
+    pending = _pending_source(poll_id) if _pending_source is not None else None
+    poll = db.query(models.Poll.question).filter(models.Poll.id == poll_id).first()
+    if not poll:
+        return None
+
+    # Read the materialized vote counters maintained by record_vote
+    results = db.query(
+        models.Option.id,
+        models.Option.text,
+        models.Option.vote_count
+    ).filter(
+        models.Option.poll_id == poll_id
+    ).order_by(models.Option.id).all()
+
+    return _payload(db, poll_id, poll.question, results, pending)
+
+
+def _counts(db: Session, poll_id: int, options, pending):
+    counts = {option_id: vote_count for option_id, _, vote_count in options}
+    if pending:
+        _merge_pending(db, poll_id, counts, pending)
+    return counts
+
+
+def _payload(db: Session, poll_id: int, question: str, options, pending):
+    counts = _counts(db, poll_id, options, pending)
+    formatted_results = [
+        {"option_id": option_id, "text": text, "vote_count": counts[option_id]}
+        for option_id, text, _ in options
+    ]
+    return {"poll_id": poll_id, "question": question, "results": formatted_results}
+
+
+def _read_polls(db: Session, poll_ids, with_text: bool = True):
+    """Yield ``(poll_id, question, options, pending)`` for the polls that exist.
+
+    Options are ``(id, text, vote_count)``, with a None text unless
+    ``with_text``. There is one poll query and one options query (per shard),
+    and ``db`` stays routed to the poll's shard until the next item.
+    """
+    poll_ids = set(poll_ids)
+    # Taken before reading the tables, as in compute_results
+    pending = {}
+    if _pending_source is not None:
+        for poll_id in poll_ids:
+            pending[poll_id] = _pending_source(poll_id)
+    questions = dict(
+        db.query(models.Poll.id, models.Poll.question).filter(models.Poll.id.in_(poll_ids))
+    )
+    text = models.Option.text if with_text else literal(None)
+    for group in sharding.partition(questions):
+        sharding.route(db, next(iter(group)))
+        options = {poll_id: [] for poll_id in group}
+        for poll_id, option_id, option_text, vote_count in db.query(
+            models.Option.poll_id, models.Option.id, text, models.Option.vote_count,
+        ).filter(models.Option.poll_id.in_(group)).order_by(models.Option.id):
+            options[poll_id].append((option_id, option_text, vote_count))
+        for poll_id in group:
+            yield poll_id, questions[poll_id], options[poll_id], pending.get(poll_id)
+
+
+def compute_many(db: Session, poll_ids):
+    """``{poll_id: payload}`` for the polls that exist, with one poll query and
+    one options query (per shard) however many polls are asked for."""
+    # Pending votes are merged while the session is routed to the shard
+    return {
+        poll_id: _payload(db, poll_id, question, options, pending)
+        for poll_id, question, options, pending in _read_polls(db, poll_ids)
+    }
+
+
+def compute_tags(db: Session, poll_ids):
+    """``{poll_id: etag}`` for the polls that exist, without building results.
+
+    Only the poll rows and the vote counters are read, so a conditional request
+    that missed the cache can still be answered with a 304 cheaply.
+    """
+    return {
+        poll_id: _tag(poll_id, question, _counts(db, poll_id, options, pending))
+        for poll_id, question, options, pending
+        in _read_polls(db, poll_ids, with_text=False)
+    }
+
+
+def _merge_pending(db: Session, poll_id: int, counts: dict, pending: dict):
+    """Apply pending votes on top of the stored counters.
+
+    Each pending vote moves its user's stored vote, if any, to the pending
+    option. Votes that were already compacted therefore change nothing.
+    """
+    user_ids = list(pending)
+    stored = {}
+    for start in range(0, len(user_ids), _PENDING_CHUNK_SIZE):
+        stored.update(
+            db.query(models.Vote.user_id, models.Vote.option_id).filter(
+                models.Vote.poll_id == poll_id,
+                models.Vote.user_id.in_(user_ids[start:start + _PENDING_CHUNK_SIZE]),
+            )
+        )
+    for user_id, option_id in pending.items():
+        previous = stored.get(user_id)
+        if previous == option_id:
+            continue
+        if option_id in counts:
+            counts[option_id] += 1
+        if previous in counts:
+            counts[previous] -= 1
+
+
+def set_pending_source(source):
+    """Merge ``source(poll_id)``'s not yet stored votes into results; None stops."""
+    global _pending_source
+    _pending_source = source
+
+
+def _tag(poll_id: int, question: str, counts: dict):
+    # Option texts never change, so the question and the counts (pending votes
+    # merged) determine the results; compute_tags needs nothing else
+    state = json.dumps([poll_id, question, sorted(counts.items())], separators=(",", ":"))
+    return '"%s"' % hashlib.blake2b(state.encode(), digest_size=8).hexdigest()
+
+
+def _entry(payload):
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+    counts = {result["option_id"]: result["vote_count"] for result in payload["results"]}
+    return CachedResults(_tag(payload["poll_id"], payload["question"], counts), body)
+
+
+def lookup(poll_id: int):
+    """Cached results for a poll, or None, without touching the database.
+
+    Only hits are counted: callers follow a miss with ``load``, which counts it.
+    """
+    return results_cache.get(poll_id, count_miss=False)
+
+
+def load(db: Session, poll_id: int, if_none_match: str = None):
+    """Return cached results for a poll, computing and caching them on a miss.
+
+    On a miss, an ``if_none_match`` naming the current version is answered with
+    a body-less entry from compute_tags, without computing the results.
+    """
+    cached = results_cache.get(poll_id)
+    if cached is not None:
+        return cached
+    if if_none_match:
+        etag = compute_tags(db, [poll_id]).get(poll_id)
+        if etag is None:
+            return None
+        if etag_matches(if_none_match, etag):
+            return CachedResults(etag, None)
+    stripe = poll_id % _GENERATION_STRIPES
+    generation = _generations[stripe]
+    payload = compute_results(db, poll_id)
+    if payload is None:
+        return None
+    entry = _entry(payload)
+    with _generations_lock:
+        if _generations[stripe] == generation:
+            results_cache.set(poll_id, entry)
+    return entry
+
+
+def load_many(db: Session, poll_ids, if_none_match: str = None):
+    """``{poll_id: CachedResults}`` for the polls that exist; like ``load``, but
+    every cache miss is computed together by ``compute_many``."""
+    entries = {}
+    missed = []
+    for poll_id in poll_ids:
+        cached = results_cache.get(poll_id)
+        if cached is not None:
+            entries[poll_id] = cached
+        else:
+            missed.append(poll_id)
+    if not missed:
+        return entries
+    if if_none_match:
+        tagged = {**entries, **{
+            poll_id: CachedResults(etag, None)
+            for poll_id, etag in compute_tags(db, missed).items()
+        }}
+        if etag_matches(if_none_match, batch_entry(poll_ids, tagged).etag):
+            return tagged
+    generations = {poll_id: _generations[poll_id % _GENERATION_STRIPES] for poll_id in missed}
+    computed = {poll_id: _entry(payload) for poll_id, payload in compute_many(db, missed).items()}
+    with _generations_lock:
+        for poll_id, entry in computed.items():
+            if _generations[poll_id % _GENERATION_STRIPES] == generations[poll_id]:
+                results_cache.set(poll_id, entry)
+    entries.update(computed)
+    return entries
+
+
+def parse_ids(ids: str):
+    """Parse ``ids=1,2,3`` into a list of distinct poll ids, in order."""
+    try:
+        poll_ids = list(dict.fromkeys(int(part) for part in ids.split(",") if part.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be comma-separated integers")
+    if not poll_ids:
+        raise HTTPException(status_code=400, detail="ids must name at least one poll")
+    if len(poll_ids) > BATCH_RESULTS_MAX:
+        raise HTTPException(
+            status_code=400, detail=f"At most {BATCH_RESULTS_MAX} polls per request"
+        )
+    return poll_ids
+
+
+def batch_entry(poll_ids, entries):
+    """Combine per-poll cached results into one response, reusing their bodies.
+
+    Results come in the order of ``poll_ids``; ids with no entry are listed
+    under ``missing``. The ETag changes whenever any poll's results do. The
+    body is None if any entry has none.
+    """
+    found = [entries[poll_id] for poll_id in poll_ids if poll_id in entries]
+    missing = [poll_id for poll_id in poll_ids if poll_id not in entries]
+    body = None
+    if all(entry.body is not None for entry in found):
+        body = b'{"results":[%s],"missing":%s}' % (
+            b",".join(entry.body for entry in found),
+            json.dumps(missing, separators=(",", ":")).encode(),
+        )
+    tags = ",".join([entry.etag for entry in found] + [str(poll_id) for poll_id in missing])
+    etag = '"%s"' % hashlib.blake2b(tags.encode(), digest_size=8).hexdigest()
+    return CachedResults(etag, body)
+
+
+def invalidate(poll_id: int):
+    with _generations_lock:
+        _generations[poll_id % _GENERATION_STRIPES] += 1
+        results_cache.pop(poll_id)
+    for listener in _listeners:
+        listener(poll_id)
+
+
+def add_listener(listener):
+    """Call ``listener(poll_id)`` whenever a poll's results change."""
+    _listeners.append(listener)
+
+
+def etag_matches(if_none_match: str, etag: str):
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def to_response(cached: CachedResults, if_none_match: str = None):
+    """304 when the client already has this version, else the cached body.
+
+    Pass the same ``if_none_match`` given to ``load``: a body-less entry only
+    comes back when it matches.
+    """
+    global not_modified
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, cached.etag):
+        not_modified += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+
+def mark_changed(db: Session, poll_id: int):
+    """Invalidate the poll's cached results once ``db`` commits."""
+    db.info.setdefault("changed_polls", set()).add(poll_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_polls(session):
+    for poll_id in session.info.pop("changed_polls", ()):
+        invalidate(poll_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_polls(session):
+    session.info.pop("changed_polls", None)
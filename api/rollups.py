@@ -0,0 +1,127 @@
+import os
+from collections import Counter
+from datetime import datetime, UTC
+from fastapi import HTTPException
+from sqlalchemy import bindparam, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from .models import Poll, VoteRollup
+
+# Per-option vote counts bucketed by time, kept in vote_rollups in the same
+# transaction as the votes. Each bucket holds the net change of the option's
+# count: a vote adds one to its option, and moving a vote also subtracts one
+# from the previous option, in the bucket of the move. Summing every bucket of
+# a resolution therefore gives the current totals. Timeseries reads scan only
+# the buckets in the requested range, whatever the number of votes.
+RESOLUTIONS = {"minute": 60, "hour": 3600}
+TIMESERIES_MAX_BUCKETS = int(os.getenv("POLLY_TIMESERIES_MAX_BUCKETS", "1440"))
+
+
+def _timestamp(when: datetime) -> int:
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=UTC)
+    return int(when.timestamp())
+
+
+def apply_rollup_deltas(db: Session, deltas):
+    """Add ``{(poll_id, option_id, cast_at): delta}`` to every resolution's buckets."""
+    buckets = Counter()
+    for (poll_id, option_id, cast_at), delta in deltas.items():
+        timestamp = _timestamp(cast_at)
+        for resolution in RESOLUTIONS.values():
+            start = timestamp - timestamp % resolution
+            buckets[(poll_id, resolution, start, option_id)] += delta
+    params = [
+        {
+            "poll": poll_id,
+            "resolution": resolution,
+            "start": start,
+            "option": option_id,
+            "delta": delta,
+        }
+        for (poll_id, resolution, start, option_id), delta in buckets.items()
+        if delta
+    ]
+    if params:
+        upsert = sqlite_insert(VoteRollup).values(
+            poll_id=bindparam("poll"),
+            resolution=bindparam("resolution"),
+            bucket_start=bindparam("start"),
+            option_id=bindparam("option"),
+            votes=bindparam("delta"),
+        )
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[
+                VoteRollup.poll_id,
+                VoteRollup.resolution,
+                VoteRollup.bucket_start,
+                VoteRollup.option_id,
+            ],
+            set_={"votes": VoteRollup.votes + upsert.excluded.votes},
+        )
+        db.connection(bind_arguments={"mapper": VoteRollup}).execute(upsert, params)
+
+
+def delete_poll_rollups(db: Session, poll_id: int):
+    db.execute(
+        delete(VoteRollup).where(VoteRollup.poll_id == poll_id),
+        execution_options={"synchronize_session": False},
+    )
+
+
+def window(bucket: str, start: datetime = None, end: datetime = None):
+    """Resolve a bucket name and optional range into ``(resolution, start, end)``.
+
+    ``end`` defaults to now and ``start`` to a day before ``end`` (or
+    TIMESERIES_MAX_BUCKETS buckets, if fewer). Both are aligned to bucket
+    boundaries and returned as Unix timestamps; ``end`` is exclusive.
+    """
+    resolution = RESOLUTIONS[bucket]
+    end_ts = _timestamp(end if end is not None else datetime.now(UTC))
+    end_ts += -end_ts % resolution
+    if start is None:
+        start_ts = end_ts - resolution * min(TIMESERIES_MAX_BUCKETS, 86400 // resolution)
+    else:
+        start_ts = _timestamp(start)
+        start_ts -= start_ts % resolution
+    if start_ts >= end_ts:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    if (end_ts - start_ts) // resolution > TIMESERIES_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range covers more than {TIMESERIES_MAX_BUCKETS} buckets; "
+                   "use a coarser bucket or a shorter range",
+        )
+    return resolution, start_ts, end_ts
+
+
+def timeseries(db: Session, poll_id: int, bucket: str, start=None, end=None):
+    """Build the timeseries payload for a poll, or None if it does not exist."""
+    resolution, start_ts, end_ts = window(bucket, start, end)
+    if db.query(Poll.id).filter(Poll.id == poll_id).first() is None:
+        return None
+    rows = (
+        db.query(VoteRollup.bucket_start, VoteRollup.option_id, VoteRollup.votes)
+        .filter(
+            VoteRollup.poll_id == poll_id,
+            VoteRollup.resolution == resolution,
+            VoteRollup.bucket_start >= start_ts,
+            VoteRollup.bucket_start < end_ts,
+            VoteRollup.votes != 0,
+        )
+        .order_by(VoteRollup.bucket_start, VoteRollup.option_id)
+    )
+    return {
+        "poll_id": poll_id,
+        "bucket": bucket,
+        "from": datetime.fromtimestamp(start_ts, UTC),
+        "to": datetime.fromtimestamp(end_ts, UTC),
+        "points": [
+            {
+                "start": datetime.fromtimestamp(bucket_start, UTC),
+                "option_id": option_id,
+                "votes": votes,
+            }
+            for bucket_start, option_id, votes in rows
+        ],
+    }
@@ -1,33 +1,55 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from typing import List
-from . import models, schemas, auth
-from .database import get_db
-from datetime import timedelta
-from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+from typing import List, Literal, Optional
+from . import (
+    models, schemas, auth, export, purge, results, rollups, search, serialization, sharding,
+)
+from .database import get_db, get_read_db
+from .journal import VoteJournal, get_vote_journal
+from .pagination import decode_id_cursor, decode_rank_cursor, encode_cursor
+from .ratelimit import limit_writes
+from .sharding import get_poll_db, get_poll_read_db
+from .votes import VoteWriter, apply_vote_batch, get_vote_writer, record_vote
+from datetime import datetime, timedelta
 
 router = APIRouter()
 
 
 @router.post("/register", response_model=schemas.UserOut)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = auth.get_user(db, user.username)
+def register(
+    user: schemas.UserCreate,
+    db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db),
+):
+    # Look up and hash without holding the writer connection
+    db_user = auth.get_user(read_db, user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
     hashed_password = auth.get_password_hash(user.password)
     new_user = models.User(username=user.username, hashed_password=hashed_password)
     db.add(new_user)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Username already registered")
     db.refresh(new_user)
     return new_user
 
 
 @router.post("/login", response_model=schemas.Token)
 def login(
-    form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: Session = Depends(get_db),
+    read_db: Session = Depends(get_read_db),
 ):
-    user = auth.authenticate_user(db, form_data.username, form_data.password)
+    # Verify against a reader; the writer is only used to store a rehash
+    user = auth.authenticate_user(
+        read_db, form_data.username, form_data.password, write_db=db
+    )
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -38,25 +60,106 @@ def login(
 
 
 @router.get("/polls", response_model=List[schemas.PollOut])
-def get_polls(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    polls = db.query(models.Poll).offset(skip).limit(limit).all()
-    return polls
+def get_polls(
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    after: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    after_id = decode_id_cursor(after) if after is not None else None
+    if serialization.FAST_JSON:
+        polls = serialization.list_polls(db, skip, limit, after_id)
+        page = response = serialization.FastJSONResponse(polls)
+        last_id = polls[-1]["id"] if polls else None
+    else:
+        # Options for the whole page are loaded with one extra IN query
+        query = db.query(models.Poll).options(
+            selectinload(models.Poll.options)
+        ).order_by(models.Poll.id)
+        if after_id is not None:
+            # Keyset paging: seek past the last id instead of walking skipped rows
+            query = query.filter(models.Poll.id > after_id)
+        else:
+            query = query.offset(skip)
+        page = polls = query.limit(limit).all()
+        last_id = polls[-1].id if polls else None
+    if limit > 0 and len(polls) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor({"id": last_id})
+    return page
+
+
+# Declared before /polls/{poll_id} so "results" is not taken for a poll id
+@router.get("/polls/results")
+def get_batch_results(
+    ids: str,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_read_db),
+):
+    # Cached polls are served as is; the misses share one poll and one options query
+    poll_ids = results.parse_ids(ids)
+    entries = results.load_many(db, poll_ids, if_none_match)
+    return results.to_response(results.batch_entry(poll_ids, entries), if_none_match)
+
+
+# Declared before /polls/{poll_id} so "search" is not taken for a poll id
+@router.get("/polls/search", response_model=List[schemas.PollOut])
+def search_polls(
+    response: Response,
+    q: str,
+    limit: int = 10,
+    after: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    match = search.match_expression(q)
+    if match is None:
+        raise HTTPException(status_code=400, detail="Search query must contain a word")
+    seek = decode_rank_cursor(after) if after is not None else None
+    hits = search.search_poll_ids(db, match, limit, seek)
+    if limit > 0 and len(hits) == limit:
+        last_id, rank = hits[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor({"rank": rank, "id": last_id})
+    return search.load_polls(db, [poll_id for poll_id, _ in hits])
 
 
 @router.get("/polls/{poll_id}", response_model=schemas.PollOut)
-def get_poll(poll_id: int, db: Session = Depends(get_db)):
+def get_poll(poll_id: int, db: Session = Depends(get_read_db)):
+    if serialization.FAST_JSON:
+        poll = serialization.get_poll(db, poll_id)
+        if not poll:
+            raise HTTPException(status_code=404, detail="Poll not found")
+        return serialization.FastJSONResponse(poll)
     poll = db.query(models.Poll).filter(models.Poll.id == poll_id).first()
     if not poll:
         raise HTTPException(status_code=404, detail="Poll not found")
     return poll
 
 
-@router.post("/polls/{poll_id}/vote", response_model=schemas.VoteOut)
+def _vote_accepted(user_id: int, poll_id: int, option_id: int):
+    return JSONResponse(
+        status_code=202,
+        content={
+            "status": "accepted",
+            "user_id": user_id,
+            "poll_id": poll_id,
+            "option_id": option_id,
+        },
+    )
+
+
+@router.post(
+    "/polls/{poll_id}/vote",
+    response_model=schemas.VoteOut,
+    responses={202: {"model": schemas.VoteAccepted}},
+)
 def vote_on_poll(
     poll_id: int,
     vote: schemas.VoteCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    wait: bool = True,
+    db: Session = Depends(get_poll_db),
+    current_user: auth.Principal = Depends(limit_writes),
+    writer: Optional[VoteWriter] = Depends(get_vote_writer),
+    vote_journal: Optional[VoteJournal] = Depends(get_vote_journal),
 ):
     # Check if the poll exists
     poll = db.query(models.Poll).filter(models.Poll.id == poll_id).first()
@@ -71,57 +174,101 @@ def vote_on_poll(
     if not option:
         raise HTTPException(status_code=404, detail="Option not found or does not belong to this poll")
     
-    # Check if the user has already voted on this poll
-    existing_vote = db.query(models.Vote).join(models.Option).filter(
-        models.Vote.user_id == current_user.id,
-        models.Option.poll_id == poll_id
-    ).first()
-    
-    if existing_vote:
-        # Update the existing vote
-        existing_vote.option_id = vote.option_id
-        db.commit()
-        db.refresh(existing_vote)
-        return existing_vote
+    if vote_journal is not None:
+        # Journal mode: append the vote; the compactor stores it in SQLite later
+        db.rollback()
+        durable = vote_journal.append(current_user.id, poll_id, vote.option_id)
+        if wait:
+            durable.result()
+        return _vote_accepted(current_user.id, poll_id, vote.option_id)
+
+    if writer is not None:
+        # Group-commit mode: hand the vote to the batching writer
+        db.rollback()
+        future = writer.submit(current_user.id, poll_id, vote.option_id)
+        if not wait:
+            return _vote_accepted(current_user.id, poll_id, vote.option_id)
+        return future.result()
     
-    # Create a new vote
-    new_vote = models.Vote(user_id=current_user.id, option_id=vote.option_id)
-    db.add(new_vote)
+    # Insert the vote, or move the user's existing vote on this poll
+    db_vote = record_vote(db, current_user.id, poll_id, vote.option_id)
     db.commit()
-    db.refresh(new_vote)
-    return new_vote
+    return db_vote
+
+
+@router.post("/votes/batch", response_model=schemas.BatchVoteOut)
+def batch_vote(
+    batch: schemas.BatchVoteCreate,
+    db: Session = Depends(get_db),
+    current_user: auth.Principal = Depends(limit_writes),
+):
+    # Voting on behalf of other users is reserved for admin imports
+    if not current_user.is_admin and any(
+        item.user_id not in (None, current_user.id) for item in batch.votes
+    ):
+        raise HTTPException(
+            status_code=403, detail="Only admins can vote on behalf of other users"
+        )
+    summary = apply_vote_batch(db, batch.votes, current_user)
+    db.commit()
+    return summary
 
 
 @router.get("/polls/{poll_id}/results")
-def get_poll_results(poll_id: int, db: Session = Depends(get_db)):
-    # Check if the poll exists
-    poll = db.query(models.Poll).filter(models.Poll.id == poll_id).first()
-    if not poll:
+def get_poll_results(
+    poll_id: int,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_poll_read_db),
+):
+    # Served from the results cache when possible; votes invalidate it. On a
+    # miss, a current If-None-Match is answered from the vote counters alone
+    cached = results.load(db, poll_id, if_none_match)
+    if cached is None:
         raise HTTPException(status_code=404, detail="Poll not found")
-    
-    # Get the options with vote counts
-    results = db.query(
-        models.Option.id,
-        models.Option.text,
-        func.count(models.Vote.id).label("vote_count")
-    ).outerjoin(models.Vote).filter(
-        models.Option.poll_id == poll_id
-    ).group_by(models.Option.id).all()
-    
-    # Format the results
-    formatted_results = [
-        {"option_id": option_id, "text": text, "vote_count": vote_count}
-        for option_id, text, vote_count in results
-    ]
-    
-    return {"poll_id": poll_id, "question": poll.question, "results": formatted_results}
+    return results.to_response(cached, if_none_match)
+
+
+@router.get("/polls/{poll_id}/results/timeseries", response_model=schemas.TimeseriesOut)
+def get_poll_timeseries(
+    poll_id: int,
+    bucket: Literal["minute", "hour"] = "minute",
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    db: Session = Depends(get_poll_read_db),
+):
+    # Reads only the rollup buckets in range, never the votes themselves
+    series = rollups.timeseries(db, poll_id, bucket, start, end)
+    if series is None:
+        raise HTTPException(status_code=404, detail="Poll not found")
+    return series
+
+
+@router.get("/polls/{poll_id}/votes/export")
+def export_votes(
+    poll_id: int,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    after_id: int = 0,
+    accept_encoding: Optional[str] = Header(None),
+    db: Session = Depends(get_poll_read_db),
+    current_user: auth.Principal = Depends(auth.get_current_reader),
+):
+    owner_id = db.query(models.Poll.owner_id).filter(models.Poll.id == poll_id).scalar()
+    if owner_id is None or owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Poll not found or not authorized")
+    compress = export.accepts_gzip(accept_encoding)
+    # Rows are read and encoded one chunk at a time while the response is sent
+    return StreamingResponse(
+        export.encode_chunks(db, poll_id, format, after_id, compress=compress),
+        media_type=export.FORMATS[format],
+        headers=export.headers(poll_id, format, compress),
+    )
 
 
 @router.post("/polls", response_model=schemas.PollOut)
 def create_poll(
     poll: schemas.PollCreate,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(limit_writes),
 ):
     # Validate that at least two options are provided
     if len(poll.options) < 2:
@@ -129,35 +276,38 @@ def create_poll(
             status_code=400, detail="At least two options are required for a poll"
         )
     
-    # Create the poll
+    # Create the poll and its options in one transaction
     new_poll = models.Poll(question=poll.question, owner_id=current_user.id)
     db.add(new_poll)
+    db.flush()
+    db.add_all(
+        models.Option(text=option_text, poll_id=new_poll.id)
+        for option_text in poll.options
+    )
+    search.index_poll(db, new_poll.id, poll.question, poll.options)
     db.commit()
     db.refresh(new_poll)
-    
-    # Create the options for the poll
-    for option_text in poll.options:
-        option = models.Option(text=option_text, poll_id=new_poll.id)
-        db.add(option)
-    
-    db.commit()
-    db.refresh(new_poll)
+    sharding.copy_options(
+        new_poll.id, [(option.id, option.poll_id, option.text) for option in new_poll.options]
+    )
     return new_poll
 
 
 @router.delete("/polls/{poll_id}", status_code=204)
 def delete_poll(
     poll_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user),
+    db: Session = Depends(get_poll_db),
+    current_user: auth.Principal = Depends(limit_writes),
 ):
     poll = (
-        db.query(models.Poll)
+        db.query(models.Poll.id)
         .filter(models.Poll.id == poll_id, models.Poll.owner_id == current_user.id)
         .first()
     )
     if not poll:
         raise HTTPException(status_code=404, detail="Poll not found or not authorized")
-    db.delete(poll)
+    # Bulk deletes; very large polls are tombstoned and purged in the background
+    purge.delete_poll(db, poll_id)
+    results.mark_changed(db, poll_id)
     db.commit()
     return None
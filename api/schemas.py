@@ -1,4 +1,4 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime, UTC
 from typing import Optional, List
 
@@ -57,3 +57,48 @@ class VoteOut(BaseModel):
     option_id: int
     created_at: datetime
     model_config = ConfigDict(from_attributes=True)
+
+
+class VoteAccepted(BaseModel):
+    status: str
+    user_id: int
+    poll_id: int
+    option_id: int
+
+
+class BatchVoteItem(BaseModel):
+    poll_id: int
+    option_id: int
+    user_id: Optional[int] = None
+
+
+class BatchVoteCreate(BaseModel):
+    votes: List[BatchVoteItem] = Field(min_length=1, max_length=1000)
+
+
+class BatchVoteResult(BaseModel):
+    index: int
+    status: str
+    vote_id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class BatchVoteOut(BaseModel):
+    recorded: int
+    rejected: int
+    results: List[BatchVoteResult]
+
+
+class TimeseriesPoint(BaseModel):
+    start: datetime
+    option_id: int
+    votes: int
+
+
+class TimeseriesOut(BaseModel):
+    poll_id: int
+    bucket: str
+    from_: datetime = Field(alias="from")
+    to: datetime
+    points: List[TimeseriesPoint]
+    model_config = ConfigDict(populate_by_name=True)
@@ -0,0 +1,88 @@
+import re
+from sqlalchemy import text
+from sqlalchemy.orm import Session, selectinload
+from . import models
+
+# Keyword search over poll questions and option texts, served by the polls_fts
+# FTS5 table declared in api/models.py. The table is maintained explicitly by
+# the routes that create and delete polls, in the same transaction as the poll
+# and its options, rather than by triggers: with sharding enabled the options
+# table also exists in shard databases that have no polls_fts.
+
+_WORD = re.compile(r"\w+")
+
+
+def match_expression(query: str):
+    """Turn free text into an FTS5 query, or None if it contains no words.
+
+    Every word must match, and the last one also matches as a prefix so that
+    results update while the user is typing; single letters are not expanded,
+    as they would match most of the index. Words are quoted, so FTS5 syntax in
+    ``query`` is searched for literally rather than interpreted.
+    """
+    words = _WORD.findall(query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    if len(words[-1]) >= 2:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def index_poll(db: Session, poll_id: int, question: str, option_texts):
+    db.execute(
+        text(
+            "INSERT INTO polls_fts (rowid, question, options) "
+            "VALUES (:poll_id, :question, :options)"
+        ),
+        {"poll_id": poll_id, "question": question, "options": "\n".join(option_texts)},
+    )
+
+
+def unindex_poll(db: Session, poll_id: int):
+    db.execute(text("DELETE FROM polls_fts WHERE rowid = :poll_id"), {"poll_id": poll_id})
+
+
+def rebuild(conn):
+    """Re-index every poll from the polls and options tables."""
+    conn.exec_driver_sql("DELETE FROM polls_fts")
+    conn.exec_driver_sql(
+        "INSERT INTO polls_fts (rowid, question, options) "
+        "SELECT polls.id, coalesce(polls.question, ''), coalesce("
+        "(SELECT group_concat(options.text, char(10)) FROM options "
+        "WHERE options.poll_id = polls.id), '') FROM polls"
+    )
+
+
+def search_poll_ids(db: Session, match: str, limit: int, after=None):
+    """Return ``[(poll_id, rank)]`` best match first; ``after`` is the last pair seen.
+
+    Ties on rank are broken by poll id, which makes ``(rank, poll_id)`` a
+    stable keyset to page on.
+    """
+    params = {"match": match, "limit": limit}
+    seek = ""
+    if after is not None:
+        seek = "AND (rank > :rank OR (rank = :rank AND rowid > :poll_id)) "
+        params["rank"], params["poll_id"] = after
+    rows = db.execute(
+        text(
+            "SELECT rowid, rank FROM polls_fts WHERE polls_fts MATCH :match "
+            f"{seek}ORDER BY rank, rowid LIMIT :limit"
+        ),
+        params,
+    )
+    return [(poll_id, rank) for poll_id, rank in rows]
+
+
+def load_polls(db: Session, poll_ids):
+    """Load polls with their options, in the order of ``poll_ids``."""
+    if not poll_ids:
+        return []
+    polls = {
+        poll.id: poll
+        for poll in db.query(models.Poll)
+        .options(selectinload(models.Poll.options))
+        .filter(models.Poll.id.in_(poll_ids))
+    }
+    return [polls[poll_id] for poll_id in poll_ids if poll_id in polls]
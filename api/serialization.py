@@ -0,0 +1,80 @@
+import json
+import os
+from fastapi import Response
+from sqlalchemy.orm import Session
+from . import models
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# Opt-in fast path for the hot poll read endpoints: rows are fetched as plain
+# tuples and the response is built and encoded once, skipping ORM object
+# construction and per-object Pydantic validation. The payload matches
+# schemas.PollOut field for field, so the published schema stays the same.
+FAST_JSON = os.getenv("POLLY_FAST_JSON", "0") == "1"
+
+
+def dumps(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(
+        payload, default=lambda value: value.isoformat(), separators=(",", ":")
+    ).encode()
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def _attach_options(db: Session, polls):
+    by_id = {poll["id"]: poll for poll in polls}
+    if by_id:
+        options = db.query(
+            models.Option.id, models.Option.text, models.Option.poll_id
+        ).filter(
+            models.Option.poll_id.in_(by_id)
+        ).order_by(models.Option.id)
+        for option_id, text, poll_id in options:
+            by_id[poll_id]["options"].append(
+                {"text": text, "id": option_id, "poll_id": poll_id}
+            )
+    return polls
+
+
+def _poll_dict(row):
+    poll_id, question, created_at, owner_id = row
+    return {
+        "id": poll_id,
+        "question": question,
+        "created_at": created_at,
+        "owner_id": owner_id,
+        "options": [],
+    }
+
+
+def _poll_rows(db: Session):
+    return db.query(
+        models.Poll.id, models.Poll.question, models.Poll.created_at, models.Poll.owner_id
+    )
+
+
+def list_polls(db: Session, skip: int, limit: int, after_id: int = None):
+    """A page of polls as PollOut-shaped dicts, in two queries."""
+    query = _poll_rows(db).order_by(models.Poll.id)
+    if after_id is not None:
+        query = query.filter(models.Poll.id > after_id)
+    else:
+        query = query.offset(skip)
+    return _attach_options(db, [_poll_dict(row) for row in query.limit(limit)])
+
+
+def get_poll(db: Session, poll_id: int):
+    row = _poll_rows(db).filter(models.Poll.id == poll_id).first()
+    if row is None:
+        return None
+    return _attach_options(db, [_poll_dict(row)])[0]
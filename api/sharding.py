@@ -0,0 +1,216 @@
+import os
+import zlib
+from fastapi import Depends
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from . import models
+from .database import (
+    Base, async_read_engine, create_engines, get_async_db, get_async_read_db, get_db,
+    get_read_db, read_engine,
+)
+
+# With POLLY_SHARDS=N (N > 1) the options, votes and vote rollups of each poll
+# live in one of N SQLite files chosen by a hash of poll_id, each with its own engine, so votes
+# on polls in different shards never wait for the same write lock. Users and
+# polls stay in the main database, which also keeps the authoritative copy of
+# every option: it allocates option ids and serves poll listings, while the
+# shard's copy carries the vote counters. Routes that act on one poll get a
+# session whose Option and Vote tables are bound to that poll's shard (see
+# route); everything else talks to the main database as before.
+SHARDS = int(os.getenv("POLLY_SHARDS", "0"))
+SHARD_PATH = os.getenv("POLLY_SHARD_PATH", "./polls-shard-{index}.db")
+
+SHARDED_MODELS = (models.Option, models.Vote, models.VoteRollup)
+
+
+class ShardRouter:
+    def __init__(self, count: int, path_template: str = SHARD_PATH):
+        self.count = count
+        self.paths = [path_template.format(index=index) for index in range(count)]
+        # Each shard has its own writer and readers, split like the main
+        # database's (see database.create_engines)
+        self.engines = []
+        self.read_engines = []
+        self.async_engines = []
+        self.async_read_engines = []
+        for path in self.paths:
+            engine, read_engine, async_engine, async_read_engine = create_engines(path)
+            self.engines.append(engine)
+            self.read_engines.append(read_engine)
+            self.async_engines.append(async_engine)
+            self.async_read_engines.append(async_read_engine)
+
+    def index(self, poll_id: int) -> int:
+        return zlib.crc32(poll_id.to_bytes(8, "little", signed=True)) % self.count
+
+    def binds(self, index: int, use_async: bool = False):
+        """Session ``binds`` sending options and votes to shard ``index``."""
+        engine = (self.async_engines if use_async else self.engines)[index]
+        return {model: engine for model in SHARDED_MODELS}
+
+    def bind(self, db: Session, poll_id: int, use_async: bool = False, read: bool = False):
+        """Route ``db``'s options and votes to the shard holding ``poll_id``."""
+        if use_async:
+            engines = self.async_read_engines if read else self.async_engines
+        else:
+            engines = self.read_engines if read else self.engines
+        engine = engines[self.index(poll_id)]
+        for model in SHARDED_MODELS:
+            db.bind_mapper(model, engine.sync_engine if use_async else engine)
+
+    def create_all(self):
+        tables = [model.__table__ for model in SHARDED_MODELS]
+        for engine in self.engines:
+            Base.metadata.create_all(bind=engine, tables=tables)
+
+    async def dispose(self):
+        for engine in {*self.engines, *self.read_engines}:
+            engine.dispose()
+        for engine in {*self.async_engines, *self.async_read_engines}:
+            await engine.dispose()
+
+
+shards = ShardRouter(SHARDS) if SHARDS > 1 else None
+
+
+def route(db, poll_id: int):
+    """Bind a Session or AsyncSession to ``poll_id``'s shard; a no-op when unsharded."""
+    if shards is None:
+        return db
+    session = db.sync_session if isinstance(db, AsyncSession) else db
+    bind = session.get_bind()
+    # Helpers shared with the async routes get AsyncSession.sync_session inside
+    # run_sync; its bind is the aiosqlite engine, and its shards must be too,
+    # or their queries would block the event loop. Reader sessions get the
+    # shard's readers, so reads never queue behind its single writer.
+    shards.bind(
+        session, poll_id, use_async=bind.dialect.is_async,
+        read=bind in (read_engine, async_read_engine.sync_engine),
+    )
+    return db
+
+
+def partition(poll_ids):
+    """Group ``poll_ids`` by shard, in shard order; a single group when unsharded."""
+    poll_ids = set(poll_ids)
+    if shards is None:
+        return [poll_ids] if poll_ids else []
+    groups = {}
+    for poll_id in poll_ids:
+        groups.setdefault(shards.index(poll_id), set()).add(poll_id)
+    return [groups[index] for index in sorted(groups)]
+
+
+def get_poll_db(poll_id: int, db: Session = Depends(get_db)):
+    """``get_db`` for routes on one poll, with its options and votes routed."""
+    return route(db, poll_id)
+
+
+def get_poll_read_db(poll_id: int, db: Session = Depends(get_read_db)):
+    return route(db, poll_id)
+
+
+async def get_poll_async_db(poll_id: int, db: AsyncSession = Depends(get_async_db)):
+    return route(db, poll_id)
+
+
+async def get_poll_async_read_db(
+    poll_id: int, db: AsyncSession = Depends(get_async_read_db)
+):
+    return route(db, poll_id)
+
+
+def copy_options_statement(options):
+    """Upsert the shard's copy of a new poll's ``(id, poll_id, text)`` options.
+
+    An upsert rather than an insert, so retrying after a failed main-database
+    commit (which may hand out the same ids again) cannot conflict.
+    """
+    rows = [
+        {"id": option_id, "poll_id": poll_id, "text": text}
+        for option_id, poll_id, text in options
+    ]
+    statement = sqlite_insert(models.Option).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=[models.Option.id],
+        set_={"poll_id": statement.excluded.poll_id, "text": statement.excluded.text,
+              "vote_count": 0},
+    )
+
+
+def copy_options(poll_id: int, options):
+    """Write a new poll's options to its shard; a no-op when unsharded."""
+    if shards is None or not options:
+        return
+    with Session(binds=shards.binds(shards.index(poll_id))) as shard_db:
+        shard_db.execute(copy_options_statement(options))
+        shard_db.commit()
+
+
+async def copy_options_async(poll_id: int, options):
+    if shards is None or not options:
+        return
+    binds = shards.binds(shards.index(poll_id), use_async=True)
+    async with AsyncSession(binds=binds) as shard_db:
+        await shard_db.execute(copy_options_statement(options))
+        await shard_db.commit()
+
+
+def delete_main_options(db: Session, poll_id: int):
+    """Delete the main database's copy of a poll's options.
+
+    ``db`` must be routed: the shard's options and votes are deleted through
+    it (see api/purge.py), which leaves only this copy behind.
+    """
+    if shards is not None:
+        db.execute(
+            delete(models.Option.__table__).where(models.Option.poll_id == poll_id),
+            bind_arguments={"bind": db.get_bind()},
+        )
+
+
+def repair_options(db: Session, batch: int = 1000):
+    """Copy main-database options missing from their shard; returns how many.
+
+    create_poll copies a poll's options to its shard after the main database
+    commits. If that copy fails, the poll exists but votes on it are rejected
+    until this runs. Options already in a shard are left untouched, counters
+    included.
+    """
+    repaired = 0
+    last_id = 0
+    while True:
+        rows = (
+            db.query(models.Option.id, models.Option.poll_id, models.Option.text)
+            .filter(models.Option.id > last_id)
+            .order_by(models.Option.id)
+            .limit(batch)
+            .all()
+        )
+        if not rows:
+            return repaired
+        last_id = rows[-1][0]
+        by_shard = {}
+        for option_id, poll_id, text in rows:
+            by_shard.setdefault(shards.index(poll_id), []).append(
+                {"id": option_id, "poll_id": poll_id, "text": text}
+            )
+        for index, options in sorted(by_shard.items()):
+            with Session(binds=shards.binds(index)) as shard_db:
+                repaired += shard_db.execute(
+                    sqlite_insert(models.Option).values(options)
+                    .on_conflict_do_nothing(index_elements=[models.Option.id])
+                ).rowcount
+                shard_db.commit()
+
+
+def vote_session_factories(session_factory):
+    """One factory per database holding votes, for maintenance across shards."""
+    if shards is None:
+        return [session_factory]
+    return [
+        lambda index=index: session_factory(binds=shards.binds(index))
+        for index in range(shards.count)
+    ]
@@ -0,0 +1,130 @@
+import asyncio
+import os
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from . import results, sharding
+from .database import ReadSessionLocal
+
+# Live results over Server-Sent Events. Each subscriber owns a one-slot queue:
+# a slow consumer only ever sees the latest snapshot, never a backlog. Changes
+# are coalesced per poll so a burst of votes costs one results read and one
+# message per subscriber every STREAM_INTERVAL_MS at most.
+STREAM_INTERVAL_MS = int(os.getenv("POLLY_STREAM_INTERVAL_MS", "250"))
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("POLLY_STREAM_HEARTBEAT_SECONDS", "15"))
+
+router = APIRouter()
+
+_DELETED = object()
+
+
+class ResultsBroadcaster:
+    def __init__(self, session_factory=ReadSessionLocal, interval_ms=STREAM_INTERVAL_MS):
+        self.session_factory = session_factory
+        self.interval = interval_ms / 1000
+        self.broadcasts = 0
+        self._subscribers = {}
+        self._scheduled = set()
+        self._loop = None
+
+    def subscriber_count(self):
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def subscribe(self, poll_id: int) -> asyncio.Queue:
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=1)
+        self._subscribers.setdefault(poll_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, poll_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(poll_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[poll_id]
+
+    def notify(self, poll_id: int):
+        """Note that a poll changed. Safe to call from any thread."""
+        loop = self._loop
+        if poll_id not in self._subscribers or loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self._schedule, poll_id)
+        except RuntimeError:
+            pass  # the loop shut down in the meantime
+
+    def _schedule(self, poll_id: int):
+        if poll_id in self._scheduled:
+            return
+        self._scheduled.add(poll_id)
+        self._loop.call_later(
+            self.interval, lambda: asyncio.ensure_future(self._broadcast(poll_id))
+        )
+
+    async def snapshot(self, poll_id: int):
+        cached = results.lookup(poll_id)
+        if cached is None:
+            cached = await run_in_threadpool(self._load, poll_id)
+        return cached
+
+    def _load(self, poll_id: int):
+        db = sharding.route(self.session_factory(), poll_id)
+        try:
+            return results.load(db, poll_id)
+        finally:
+            db.close()
+
+    async def _broadcast(self, poll_id: int):
+        self._scheduled.discard(poll_id)
+        if not self._subscribers.get(poll_id):
+            return
+        cached = await self.snapshot(poll_id)
+        self.broadcasts += 1
+        for queue in list(self._subscribers.get(poll_id, ())):
+            if queue.full():
+                queue.get_nowait()  # drop the snapshot the consumer has not read
+            queue.put_nowait(_DELETED if cached is None else cached)
+
+    async def events(self, poll_id: int, queue: asyncio.Queue, initial, last_event_id=None):
+        """Yield SSE frames for ``queue`` until the poll is deleted or the client leaves."""
+        try:
+            if initial.etag != last_event_id:
+                yield _frame(initial)
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is _DELETED:
+                    yield "event: deleted\ndata: {}\n\n"
+                    return
+                yield _frame(item)
+        finally:
+            self.unsubscribe(poll_id, queue)
+
+
+def _frame(cached):
+    return f"id: {cached.etag}\nevent: results\ndata: {cached.body.decode()}\n\n"
+
+
+broadcaster = ResultsBroadcaster()
+results.add_listener(broadcaster.notify)
+
+
+@router.get("/polls/{poll_id}/results/stream")
+async def stream_poll_results(
+    poll_id: int, last_event_id: Optional[str] = Header(None)
+):
+    # Subscribe before taking the snapshot so no change can fall in between
+    queue = broadcaster.subscribe(poll_id)
+    initial = await broadcaster.snapshot(poll_id)
+    if initial is None:
+        broadcaster.unsubscribe(poll_id, queue)
+        raise HTTPException(status_code=404, detail="Poll not found")
+    return StreamingResponse(
+        broadcaster.events(poll_id, queue, initial, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,345 @@
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from datetime import datetime, UTC
+from fastapi import HTTPException
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from . import models, results, schemas, sharding
+from .counters import apply_vote_deltas
+from .rollups import apply_rollup_deltas
+
+GROUP_COMMIT = os.getenv("POLLY_GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_INTERVAL_MS = int(os.getenv("POLLY_GROUP_COMMIT_INTERVAL_MS", "10"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("POLLY_GROUP_COMMIT_MAX_BATCH", "500"))
+
+
+UPSERT_CHUNK_SIZE = 500
+
+
+def record_votes(db: Session, votes):
+    """Insert or move many ``(user_id, poll_id, option_id)`` votes at once.
+
+    The last vote wins: a user has at most one vote per poll, enforced by the
+    unique ``(user_id, poll_id)`` index, and within ``votes`` the last entry
+    per pair wins. A vote may carry the time it was cast as a fourth element;
+    otherwise it is stamped now. Each chunk of votes is written with a single
+    ``INSERT ... ON CONFLICT DO UPDATE`` and counters are adjusted with
+    executemany. Returns the written vote row per ``(user_id, poll_id)``. The
+    caller is responsible for validating the options and for committing.
+    """
+    now = datetime.now(UTC)
+    latest = {}
+    cast_at = {}
+    for user_id, poll_id, option_id, *created_at in votes:
+        latest[(user_id, poll_id)] = option_id
+        cast_at[(user_id, poll_id)] = created_at[0] if created_at else now
+    if not latest:
+        return {}
+
+    # Count every vote towards its new option first. This is the transaction's
+    # first write, so SQLite's write lock is held before the previous options
+    # are read below and no concurrent vote can move them in between.
+    apply_vote_deltas(db, Counter(latest.values()))
+
+    user_ids = {user_id for user_id, _ in latest}
+    poll_ids = {poll_id for _, poll_id in latest}
+    previous = {
+        (user_id, poll_id): option_id
+        for user_id, poll_id, option_id in db.query(
+            models.Vote.user_id, models.Vote.poll_id, models.Vote.option_id
+        ).filter(
+            models.Vote.user_id.in_(user_ids),
+            models.Vote.poll_id.in_(poll_ids)
+        )
+        if (user_id, poll_id) in latest
+    }
+    apply_vote_deltas(
+        db, {option_id: -count for option_id, count in Counter(previous.values()).items()}
+    )
+
+    # The same net changes, bucketed by the time each vote was cast
+    changes = Counter()
+    for key, option_id in latest.items():
+        if previous.get(key) != option_id:
+            changes[(key[1], option_id, cast_at[key])] += 1
+            if key in previous:
+                changes[(key[1], previous[key], cast_at[key])] -= 1
+    apply_rollup_deltas(db, changes)
+
+    rows = [
+        {
+            "user_id": user_id,
+            "poll_id": poll_id,
+            "option_id": option_id,
+            "created_at": cast_at[(user_id, poll_id)],
+        }
+        for (user_id, poll_id), option_id in latest.items()
+    ]
+    written = {}
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        upsert = sqlite_insert(models.Vote).values(rows[start:start + UPSERT_CHUNK_SIZE])
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[models.Vote.user_id, models.Vote.poll_id],
+            set_={"option_id": upsert.excluded.option_id},
+        ).returning(
+            models.Vote.id,
+            models.Vote.user_id,
+            models.Vote.poll_id,
+            models.Vote.option_id,
+            models.Vote.created_at,
+        )
+        for row in db.execute(upsert):
+            written[(row.user_id, row.poll_id)] = row
+    for poll_id in poll_ids:
+        results.mark_changed(db, poll_id)
+    return written
+
+
+def record_vote(db: Session, user_id: int, poll_id: int, option_id: int):
+    """Insert or move a single vote; see record_votes."""
+    return record_votes(db, [(user_id, poll_id, option_id)])[(user_id, poll_id)]
+
+
+def apply_vote_batch(db: Session, items, current_user):
+    """Validate and record a batch of votes, reporting a status per item.
+
+    Items without a ``user_id`` are cast as ``current_user``; only admins may
+    vote on behalf of other users. Poll existence, option/poll membership and
+    user existence are checked with one query each (per shard for options),
+    and all valid votes are written together.
+    """
+    voter_ids = {item.user_id for item in items if item.user_id is not None}
+    known_users = {
+        user_id for (user_id,) in
+        db.query(models.User.id).filter(models.User.id.in_(voter_ids))
+    }
+
+    # Options of a poll being purged outlive the poll (see api/purge.py)
+    live_polls = {
+        poll_id for (poll_id,) in
+        db.query(models.Poll.id).filter(models.Poll.id.in_({item.poll_id for item in items}))
+    }
+
+    outcomes = [None] * len(items)
+    accepted = []
+    written = {}
+    # With sharding each shard's votes are validated, written and committed on
+    # their own, so a batch is atomic per shard rather than as a whole.
+    for poll_ids in sharding.partition(item.poll_id for item in items):
+        sharding.route(db, next(iter(poll_ids)))
+        entries = [(index, item) for index, item in enumerate(items) if item.poll_id in poll_ids]
+        option_polls = dict(
+            db.query(models.Option.id, models.Option.poll_id)
+            .filter(models.Option.id.in_({item.option_id for _, item in entries}))
+            .all()
+        )
+        shard_accepted = []
+        for index, item in entries:
+            user_id = current_user.id if item.user_id is None else item.user_id
+            if item.poll_id not in live_polls:
+                detail = "Poll not found"
+            elif option_polls.get(item.option_id) != item.poll_id:
+                detail = "Option not found or does not belong to this poll"
+            elif user_id != current_user.id and user_id not in known_users:
+                detail = "User not found"
+            else:
+                shard_accepted.append((index, (user_id, item.poll_id, item.option_id)))
+                continue
+            outcomes[index] = {"index": index, "status": "rejected", "detail": detail}
+        written.update(record_votes(db, [vote for _, vote in shard_accepted]))
+        if sharding.shards is not None:
+            db.commit()
+        accepted.extend(shard_accepted)
+
+    last_index = {vote[:2]: index for index, vote in sorted(accepted)}
+    for index, vote in accepted:
+        key = vote[:2]
+        outcomes[index] = {
+            "index": index,
+            "status": "recorded" if last_index[key] == index else "superseded",
+            "vote_id": written[key].id,
+        }
+    rejected = len(items) - len(accepted)
+    return {"recorded": len(accepted), "rejected": rejected, "results": outcomes}
+
+
+class _PendingVote:
+    __slots__ = ("user_id", "poll_id", "option_id", "future")
+
+    def __init__(self, user_id, poll_id, option_id):
+        self.user_id = user_id
+        self.poll_id = poll_id
+        self.option_id = option_id
+        self.future = Future()
+
+
+_STOP = object()
+
+
+class VoteWriter:
+    """Single background writer that commits queued votes in batches.
+
+    Votes are flushed every ``interval_ms`` milliseconds or as soon as
+    ``max_batch`` votes are waiting, whichever comes first, so many votes share
+    one transaction (and one fsync). Within a batch the last vote per user and
+    poll wins, exactly as if the votes had been committed one at a time.
+    """
+
+    def __init__(self, session_factory, interval_ms=GROUP_COMMIT_INTERVAL_MS,
+                 max_batch=GROUP_COMMIT_MAX_BATCH):
+        self.session_factory = session_factory
+        self.interval = interval_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="polly-vote-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Flush everything queued so far and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, user_id: int, poll_id: int, option_id: int) -> Future:
+        """Queue a validated vote; the future resolves to a ``VoteOut`` once durable."""
+        pending = _PendingVote(user_id, poll_id, option_id)
+        self._queue.put(pending)
+        return pending.future
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+    def _flush(self, batch):
+        latest = {}
+        for pending in batch:
+            latest[(pending.user_id, pending.poll_id)] = pending
+        try:
+            written = self._write(latest.values())
+        except Exception:
+            # One bad vote must not sink the whole batch: retry individually.
+            written = {}
+            for pending in latest.values():
+                try:
+                    written.update(self._write([pending]))
+                except Exception as exc:
+                    written[(pending.user_id, pending.poll_id)] = exc
+        for pending in batch:
+            outcome = written[(pending.user_id, pending.poll_id)]
+            if isinstance(outcome, Exception):
+                pending.future.set_exception(outcome)
+            else:
+                pending.future.set_result(outcome)
+
+    def _write(self, pending_votes):
+        db = self.session_factory()
+        try:
+            # Votes were validated when queued; drop those whose poll was
+            # deleted since (a poll being purged still has its options)
+            live_polls = {
+                poll_id for (poll_id,) in db.query(models.Poll.id).filter(
+                    models.Poll.id.in_({p.poll_id for p in pending_votes})
+                )
+            }
+            option_polls = dict(
+                db.query(models.Option.id, models.Option.poll_id)
+                .filter(models.Option.id.in_({p.option_id for p in pending_votes}))
+                .all()
+            )
+            written, valid = {}, []
+            for p in pending_votes:
+                if p.poll_id not in live_polls:
+                    detail = "Poll not found"
+                elif option_polls.get(p.option_id) != p.poll_id:
+                    detail = "Option not found or does not belong to this poll"
+                else:
+                    valid.append((p.user_id, p.poll_id, p.option_id))
+                    continue
+                written[(p.user_id, p.poll_id)] = HTTPException(status_code=404, detail=detail)
+            votes = record_votes(db, valid)
+            written.update(
+                (key, schemas.VoteOut.model_validate(vote)) for key, vote in votes.items()
+            )
+            db.commit()
+            return written
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+class ShardedVoteWriter:
+    """One VoteWriter per shard, so batches on different shards commit in parallel."""
+
+    def __init__(self, session_factory, **options):
+        self.writers = [
+            VoteWriter(factory, **options)
+            for factory in sharding.vote_session_factories(session_factory)
+        ]
+
+    def start(self):
+        for writer in self.writers:
+            writer.start()
+
+    def stop(self):
+        for writer in self.writers:
+            writer.stop()
+
+    def submit(self, user_id: int, poll_id: int, option_id: int) -> Future:
+        writer = self.writers[sharding.shards.index(poll_id)]
+        return writer.submit(user_id, poll_id, option_id)
+
+
+_writer = None
+
+
+def start_writer(session_factory, **options):
+    global _writer
+    if sharding.shards is not None:
+        _writer = ShardedVoteWriter(session_factory, **options)
+    else:
+        _writer = VoteWriter(session_factory, **options)
+    _writer.start()
+    return _writer
+
+
+def stop_writer():
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+
+
+def get_vote_writer():
+    """Dependency returning the running group-commit writer, or None."""
+    return _writer
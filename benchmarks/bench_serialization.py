@@ -0,0 +1,95 @@
+"""Compare the validated and fast JSON paths of GET /polls and GET /polls/{id}.
+
+Seeds a temporary SQLite database and times both read endpoints in-process
+with each serialization path:
+
+    python benchmarks/bench_serialization.py --polls 2000 --limit 100
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from api import models, serialization
+from api.database import Base, get_db, get_read_db
+from main import app
+
+
+def seed(session_factory, polls, options):
+    db = session_factory()
+    try:
+        owner = models.User(username="bench", hashed_password="x")
+        db.add(owner)
+        db.flush()
+        for i in range(polls):
+            poll = models.Poll(question=f"Benchmark poll {i}?", owner_id=owner.id)
+            poll.options = [models.Option(text=f"Option {j}") for j in range(options)]
+            db.add(poll)
+        db.commit()
+    finally:
+        db.close()
+
+
+def measure(client, path, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(path)
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--polls", type=int, default=1000)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(
+            f"sqlite:///{os.path.join(directory, 'bench.db')}",
+            connect_args={"check_same_thread": False},
+        )
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(autoflush=False, bind=engine)
+        seed(session_factory, args.polls, args.options)
+
+        def override_get_db():
+            db = session_factory()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app.dependency_overrides[get_db] = override_get_db
+        app.dependency_overrides[get_read_db] = override_get_db
+        client = TestClient(app)
+        paths = [f"/polls?limit={args.limit}", "/polls/1"]
+
+        print(f"{'endpoint':<24}{'path':<11}{'mean ms':>10}{'p95 ms':>10}")
+        for path in paths:
+            means = {}
+            for fast in (False, True):
+                serialization.FAST_JSON = fast
+                measure(client, path, 10)  # warm up
+                timings = sorted(measure(client, path, args.requests))
+                means[fast] = statistics.mean(timings)
+                p95 = timings[int(len(timings) * 0.95) - 1]
+                label = "fast" if fast else "validated"
+                print(f"{path:<24}{label:<11}{means[fast] * 1000:>10.2f}{p95 * 1000:>10.2f}")
+            print(f"{'':<24}{'speedup':<11}{means[False] / means[True]:>10.2f}x")
+        app.dependency_overrides.clear()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
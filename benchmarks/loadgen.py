@@ -0,0 +1,295 @@
+"""Load generator reporting throughput and latency percentiles per route.
+
+Runs asyncio virtual users that follow the client.py flows (register, login,
+create a poll, vote, read results) against a local uvicorn started on a
+temporary SQLite file, or against an existing server with --url:
+
+    python benchmarks/loadgen.py vote-hotspot --users 50 --duration 20
+    python benchmarks/loadgen.py read-heavy --output after.json --baseline before.json
+    python benchmarks/loadgen.py custom --mix vote=5,results=3,create=1
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, UTC
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+from client import AsyncPollyClient, PollyAPIError  # noqa: E402
+
+ROUTES = {
+    "register": "POST /register",
+    "login": "POST /login",
+    "create": "POST /polls",
+    "vote": "POST /polls/{poll_id}/vote",
+    "results": "GET /polls/{poll_id}/results",
+}
+
+# Relative weights of each operation; "hot_polls" limits votes and reads to
+# the first N seeded polls.
+SCENARIOS = {
+    "vote-hotspot": {"mix": {"vote": 1}, "hot_polls": 1},
+    "read-heavy": {"mix": {"results": 9, "vote": 1}, "hot_polls": None},
+    "login-storm": {"mix": {"login": 1}, "hot_polls": None},
+    "custom": {"mix": {"vote": 5, "results": 3, "create": 1}, "hot_polls": None},
+}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ROUTES:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies, errors, elapsed):
+    ordered = sorted(latencies)
+    as_ms = lambda value: None if value is None else round(value * 1000, 3)
+    return {
+        "requests": len(ordered),
+        "errors": dict(errors),
+        "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": as_ms(sum(ordered) / len(ordered)) if ordered else None,
+        "p50_ms": as_ms(percentile(ordered, 50)),
+        "p95_ms": as_ms(percentile(ordered, 95)),
+        "p99_ms": as_ms(percentile(ordered, 99)),
+        "max_ms": as_ms(ordered[-1]) if ordered else None,
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    async def timed(self, operation, call):
+        start = time.perf_counter()
+        try:
+            return await call
+        except PollyAPIError as exc:
+            self.errors[operation][str(exc.status_code)] += 1
+        except httpx.HTTPError as exc:
+            self.errors[operation][type(exc).__name__] += 1
+        finally:
+            self.latencies[operation].append(time.perf_counter() - start)
+
+    def report(self, elapsed):
+        routes = {
+            ROUTES[operation]: summarize(
+                self.latencies[operation], self.errors[operation], elapsed
+            )
+            for operation in ROUTES
+            if self.latencies[operation]
+        }
+        everything = [value for values in self.latencies.values() for value in values]
+        errors = defaultdict(int)
+        for counts in self.errors.values():
+            for key, count in counts.items():
+                errors[key] += count
+        return routes, summarize(everything, errors, elapsed)
+
+
+class VirtualUser:
+    def __init__(self, index, http, polls, recorder, rng):
+        self.username = f"bench_{os.getpid()}_{index}"
+        self.password = "benchpass"
+        self.polly = AsyncPollyClient(http_client=http, retries=0)
+        self.polls = polls
+        self.recorder = recorder
+        self.rng = rng
+        self.created = 0
+
+    async def setup(self):
+        await self.polly.register(self.username, self.password)
+        await self.polly.login(self.username, self.password)
+
+    def _pick_poll(self):
+        return self.rng.choice(self.polls)
+
+    async def step(self, operation):
+        polly = self.polly
+        if operation == "register":
+            self.created += 1
+            call = polly.register(f"{self.username}_{self.created}", self.password)
+        elif operation == "login":
+            call = polly.login(self.username, self.password)
+        elif operation == "create":
+            call = polly.create_poll("Benchmark poll?", ["Yes", "No", "Maybe"])
+        elif operation == "vote":
+            poll = self._pick_poll()
+            call = polly.vote(poll["id"], self.rng.choice(poll["options"])["id"])
+        else:
+            call = polly.get_poll_results(self._pick_poll()["id"])
+        await self.recorder.timed(operation, call)
+
+    async def run(self, mix, deadline):
+        operations, weights = zip(*mix.items())
+        while time.monotonic() < deadline:
+            await self.step(self.rng.choices(operations, weights)[0])
+
+
+async def run_load(base_url, args, mix, hot_polls):
+    limits = httpx.Limits(max_connections=args.pool_size,
+                          max_keepalive_connections=args.pool_size)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits,
+                                 timeout=args.timeout) as http:
+        rng = random.Random(args.seed)
+        owner = AsyncPollyClient(http_client=http, retries=0)
+        owner_name = f"bench_{os.getpid()}_owner"
+        await owner.register(owner_name, "benchpass")
+        await owner.login(owner_name, "benchpass")
+        polls = [
+            await owner.create_poll(f"Seeded poll {i}?", ["Red", "Green", "Blue"])
+            for i in range(args.polls)
+        ]
+        targets = polls[:hot_polls] if hot_polls else polls
+
+        recorder = Recorder()
+        users = [
+            VirtualUser(i, http, targets, recorder, random.Random(rng.random()))
+            for i in range(args.users)
+        ]
+        # Registration and first login are setup, not part of the measurement
+        await asyncio.gather(*(user.setup() for user in users))
+
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(*(user.run(mix, deadline) for user in users))
+        elapsed = time.monotonic() - started
+        return elapsed, *recorder.report(elapsed)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(database_path, port):
+    env = dict(os.environ, POLLY_DATABASE_PATH=database_path)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app",
+         "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        cwd=ROOT,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("uvicorn exited during startup")
+        try:
+            httpx.get(f"{base_url}/polls", timeout=1)
+            return process, base_url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("uvicorn did not start within 30 seconds")
+
+
+def compare(report, baseline):
+    """Print the change of throughput and p95/p99 against an earlier report."""
+    print(f"\nAgainst baseline {baseline['started_at']}:")
+    for route, current in report["routes"].items():
+        previous = baseline["routes"].get(route)
+        if not previous:
+            continue
+        changes = []
+        for key in ("throughput_rps", "p95_ms", "p99_ms"):
+            if current[key] is not None and previous[key]:
+                delta = (current[key] - previous[key]) / previous[key] * 100
+                changes.append(f"{key} {delta:+.1f}%")
+        print(f"  {route:<30}{', '.join(changes)}")
+
+
+def print_report(report):
+    print(f"\nScenario {report['scenario']}: {report['config']['users']} users, "
+          f"{report['duration_s']:.1f}s")
+    header = f"{'route':<30}{'requests':>9}{'errors':>8}{'req/s':>9}" \
+             f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    print(header)
+    rows = list(report["routes"].items()) + [("total", report["total"])]
+    for route, stats in rows:
+        print(f"{route:<30}{stats['requests']:>9}{sum(stats['errors'].values()):>8}"
+              f"{stats['throughput_rps']:>9.1f}{stats['p50_ms']:>9.2f}"
+              f"{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--mix", type=parse_mix,
+                        help="operation weights, e.g. vote=5,results=3 (custom scenario)")
+    parser.add_argument("--users", type=int, default=20, help="virtual users")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+    parser.add_argument("--polls", type=int, default=20, help="polls seeded before the run")
+    parser.add_argument("--pool-size", type=int, default=100, help="client connections")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="benchmark an already running server instead")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    args = parser.parse_args()
+
+    scenario = SCENARIOS[args.scenario]
+    mix = args.mix or scenario["mix"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        process = None
+        base_url = args.url
+        if base_url is None:
+            process, base_url = start_server(os.path.join(directory, "bench.db"), _free_port())
+        try:
+            started_at = datetime.now(UTC).isoformat()
+            elapsed, routes, total = asyncio.run(run_load(base_url, args, mix, scenario["hot_polls"]))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    report = {
+        "scenario": args.scenario,
+        "started_at": started_at,
+        "duration_s": round(elapsed, 3),
+        "config": {
+            "users": args.users,
+            "polls": args.polls,
+            "mix": mix,
+            "hot_polls": scenario["hot_polls"],
+            "env": {k: v for k, v in os.environ.items() if k.startswith("POLLY_")},
+        },
+        "routes": routes,
+        "total": total,
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(report, fh, indent=2)
+    if args.baseline:
+        with open(args.baseline) as fh:
+            compare(report, json.load(fh))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import asyncio
+import httpx
 import requests
 import time
 
@@ -143,6 +145,309 @@ def get_poll_results(poll_id, base_url="http://localhost:8000"):
         return None
 
 
+DEFAULT_BASE_URL = "http://localhost:8000"
+# Responses worth retrying when the request is safe to repeat
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class PollyAPIError(Exception):
+    """An error response from the API, raised by PollyClient and AsyncPollyClient."""
+
+    def __init__(self, status_code, detail):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _check(response):
+    if response.is_success:
+        return response
+    try:
+        body = response.json()
+        detail = body.get("detail", body) if isinstance(body, dict) else body
+    except ValueError:
+        detail = response.text
+    raise PollyAPIError(response.status_code, detail)
+
+
+class _ClientBase:
+    def __init__(self, username, password, token, retries, backoff):
+        self.username = username
+        self.password = password
+        self.token = token
+        self.retries = retries
+        self.backoff = backoff
+
+    def _headers(self, auth):
+        if auth and self.token:
+            return {"Authorization": f"Bearer {self.token}"}
+        return None
+
+    def _can_relogin(self, auth):
+        return auth and self.username is not None and self.password is not None
+
+    def _retry_delay(self, attempt, response):
+        """Honour Retry-After when the server sends one, else back off exponentially."""
+        if response is not None:
+            try:
+                return float(response.headers["Retry-After"])
+            except (KeyError, ValueError):
+                pass
+        return self.backoff * 2 ** attempt
+
+    def _should_retry(self, idempotent, attempt, response):
+        if not idempotent or attempt >= self.retries:
+            return False
+        return response is None or response.status_code in RETRY_STATUSES
+
+
+class PollyClient(_ClientBase):
+    """Pooled, keep-alive client for the Polly API.
+
+    One instance reuses up to ``pool_size`` connections for all calls and keeps
+    the access token; authenticated calls that get a 401 log in again once with
+    the stored credentials. Idempotent calls (reads, deletes and votes, which
+    the server upserts) are retried with exponential backoff on connection
+    errors and 429/502/503/504 responses. Error responses raise PollyAPIError.
+
+    Example::
+
+        with PollyClient(username="alice", password="secret") as polly:
+            polly.login()
+            polly.vote(poll_id=1, option_id=2)
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, username=None, password=None,
+                 token=None, pool_size=10, timeout=10.0, retries=3, backoff=0.1,
+                 http_client=None):
+        super().__init__(username, password, token, retries, backoff)
+        self.http = http_client or httpx.Client(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.http.close()
+
+    def _request(self, method, path, auth=False, idempotent=False, **kwargs):
+        attempt = 0
+        relogged = False
+        while True:
+            response = None
+            try:
+                response = self.http.request(
+                    method, path, headers=self._headers(auth), **kwargs
+                )
+            except httpx.TransportError:
+                if not self._should_retry(idempotent, attempt, None):
+                    raise
+            else:
+                if response.status_code == 401 and not relogged and self._can_relogin(auth):
+                    relogged = True
+                    self.login()
+                    continue
+                if not self._should_retry(idempotent, attempt, response):
+                    return _check(response)
+            time.sleep(self._retry_delay(attempt, response))
+            attempt += 1
+
+    def register(self, username, password):
+        data = {"username": username, "password": password}
+        return self._request("POST", "/register", json=data).json()
+
+    def login(self, username=None, password=None):
+        """Log in and keep the token (and credentials) for later calls."""
+        if username is not None:
+            self.username, self.password = username, password
+        data = {"username": self.username, "password": self.password}
+        response = self._request("POST", "/login", idempotent=True, data=data)
+        self.token = response.json()["access_token"]
+        return self.token
+
+    def get_polls(self, limit=10, after=None):
+        """Return ``(polls, next_cursor)``; pass the cursor back as ``after``."""
+        params = {"limit": limit}
+        if after is not None:
+            params["after"] = after
+        response = self._request("GET", "/polls", idempotent=True, params=params)
+        return response.json(), response.headers.get("X-Next-Cursor")
+
+    def iter_polls(self, page_size=100):
+        """Yield every poll, following keyset cursors page by page."""
+        cursor = None
+        while True:
+            polls, cursor = self.get_polls(limit=page_size, after=cursor)
+            yield from polls
+            if cursor is None:
+                return
+
+    def get_poll(self, poll_id):
+        return self._request("GET", f"/polls/{poll_id}", idempotent=True).json()
+
+    def create_poll(self, question, options):
+        data = {"question": question, "options": options}
+        return self._request("POST", "/polls", auth=True, json=data).json()
+
+    def vote(self, poll_id, option_id):
+        return self._request(
+            "POST", f"/polls/{poll_id}/vote", auth=True, idempotent=True,
+            json={"option_id": option_id},
+        ).json()
+
+    def vote_batch(self, votes):
+        """Cast ``(poll_id, option_id)`` pairs or dicts through POST /votes/batch."""
+        items = [
+            vote if isinstance(vote, dict) else {"poll_id": vote[0], "option_id": vote[1]}
+            for vote in votes
+        ]
+        return self._request(
+            "POST", "/votes/batch", auth=True, idempotent=True, json={"votes": items}
+        ).json()
+
+    def get_poll_results(self, poll_id):
+        return self._request("GET", f"/polls/{poll_id}/results", idempotent=True).json()
+
+    def delete_poll(self, poll_id):
+        self._request("DELETE", f"/polls/{poll_id}", auth=True, idempotent=True)
+
+
+class AsyncPollyClient(_ClientBase):
+    """asyncio twin of PollyClient sharing one connection pool across tasks.
+
+    Concurrent calls that hit an expired token trigger a single re-login.
+    ``vote_many`` casts many votes concurrently over the pool.
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, username=None, password=None,
+                 token=None, pool_size=10, timeout=10.0, retries=3, backoff=0.1,
+                 http_client=None):
+        super().__init__(username, password, token, retries, backoff)
+        self.pool_size = pool_size
+        self.http = http_client or httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+        )
+        self._login_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        await self.http.aclose()
+
+    async def _relogin(self, stale_token):
+        async with self._login_lock:
+            # Another task may already have refreshed the token
+            if self.token == stale_token:
+                await self.login()
+
+    async def _request(self, method, path, auth=False, idempotent=False, **kwargs):
+        attempt = 0
+        relogged = False
+        while True:
+            response = None
+            token = self.token
+            try:
+                response = await self.http.request(
+                    method, path, headers=self._headers(auth), **kwargs
+                )
+            except httpx.TransportError:
+                if not self._should_retry(idempotent, attempt, None):
+                    raise
+            else:
+                if response.status_code == 401 and not relogged and self._can_relogin(auth):
+                    relogged = True
+                    await self._relogin(token)
+                    continue
+                if not self._should_retry(idempotent, attempt, response):
+                    return _check(response)
+            await asyncio.sleep(self._retry_delay(attempt, response))
+            attempt += 1
+
+    async def register(self, username, password):
+        data = {"username": username, "password": password}
+        return (await self._request("POST", "/register", json=data)).json()
+
+    async def login(self, username=None, password=None):
+        if username is not None:
+            self.username, self.password = username, password
+        data = {"username": self.username, "password": self.password}
+        response = await self._request("POST", "/login", idempotent=True, data=data)
+        self.token = response.json()["access_token"]
+        return self.token
+
+    async def get_polls(self, limit=10, after=None):
+        params = {"limit": limit}
+        if after is not None:
+            params["after"] = after
+        response = await self._request("GET", "/polls", idempotent=True, params=params)
+        return response.json(), response.headers.get("X-Next-Cursor")
+
+    async def get_poll(self, poll_id):
+        return (await self._request("GET", f"/polls/{poll_id}", idempotent=True)).json()
+
+    async def create_poll(self, question, options):
+        data = {"question": question, "options": options}
+        return (await self._request("POST", "/polls", auth=True, json=data)).json()
+
+    async def vote(self, poll_id, option_id):
+        response = await self._request(
+            "POST", f"/polls/{poll_id}/vote", auth=True, idempotent=True,
+            json={"option_id": option_id},
+        )
+        return response.json()
+
+    async def vote_many(self, votes, concurrency=None):
+        """Cast ``(poll_id, option_id)`` votes concurrently.
+
+        At most ``concurrency`` (default: the pool size) requests are in flight.
+        Returns one result per vote, in order; failed votes are returned as
+        their exception instead of aborting the others.
+        """
+        limit = asyncio.Semaphore(concurrency or self.pool_size)
+
+        async def cast(poll_id, option_id):
+            async with limit:
+                return await self.vote(poll_id, option_id)
+
+        return await asyncio.gather(
+            *(cast(poll_id, option_id) for poll_id, option_id in votes),
+            return_exceptions=True,
+        )
+
+    async def vote_batch(self, votes):
+        items = [
+            vote if isinstance(vote, dict) else {"poll_id": vote[0], "option_id": vote[1]}
+            for vote in votes
+        ]
+        response = await self._request(
+            "POST", "/votes/batch", auth=True, idempotent=True, json={"votes": items}
+        )
+        return response.json()
+
+    async def get_poll_results(self, poll_id):
+        response = await self._request("GET", f"/polls/{poll_id}/results", idempotent=True)
+        return response.json()
+
+    async def delete_poll(self, poll_id):
+        await self._request("DELETE", f"/polls/{poll_id}", auth=True, idempotent=True)
+
+
 if __name__ == "__main__":
     # It's good practice to have a base URL configuration
     BASE_URL = "http://localhost:8000"
@@ -1,10 +1,56 @@
-from fastapi import FastAPI
-from api.database import Base, engine
-from api import models
-from api.routes import router
+import api
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# Settings are read at import time, so .env has to be loaded before api modules
+api.load_env_file()
 
-app = FastAPI()
-app.include_router(router)
+from contextlib import asynccontextmanager  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from api.database import (  # noqa: E402
+    DB_MODE, SessionLocal, async_engine, async_read_engine, engine,
+)
+from api import (  # noqa: E402
+    hashing, journal, metrics, migrations, profiling, purge, sharding, streaming, votes,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Cheap version check; creates or migrates the schema only when needed
+    migrations.ensure_schema(engine)
+    if sharding.shards is not None:
+        sharding.shards.create_all()
+    if journal.JOURNAL:
+        journal.start_journal(SessionLocal)
+    if votes.GROUP_COMMIT:
+        votes.start_writer(SessionLocal)
+    purge.start_purger(SessionLocal)
+    yield
+    purge.stop_purger()
+    journal.stop_journal()
+    votes.stop_writer()
+    hashing.shutdown()
+    await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
+    if sharding.shards is not None:
+        await sharding.shards.dispose()
+
+
+def create_app(db_mode: str = DB_MODE) -> FastAPI:
+    """Build the application. Nothing touches the database until startup."""
+    if db_mode == "async":
+        from api.async_routes import router
+    else:
+        from api.routes import router
+
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(metrics.MetricsMiddleware)
+    if profiling.PROFILING:
+        app.add_middleware(profiling.ProfilingMiddleware)
+    app.include_router(router)
+    app.include_router(streaming.router)
+    app.include_router(metrics.router)
+    return app
+
+
+app = create_app()
@@ -0,0 +1,113 @@
+import argparse
+import sys
+import api
+
+api.load_env_file()
+
+from api.database import SessionLocal, engine  # noqa: E402
+from api import counters, migrations, purge, sharding  # noqa: E402
+from api.models import User  # noqa: E402
+
+
+def migrate(args):
+    migrations.upgrade(engine)
+    if sharding.shards is not None:
+        sharding.shards.create_all()
+        print(f"Created the tables of {sharding.shards.count} shard(s).")
+    print(f"Database is at schema version {migrations.SCHEMA_VERSION}.")
+
+
+def verify_counters(args):
+    mismatches = []
+    for session_factory in sharding.vote_session_factories(SessionLocal):
+        db = session_factory()
+        try:
+            mismatches.extend(counters.verify_vote_counts(db))
+        finally:
+            db.close()
+    for option_id, stored, actual in mismatches:
+        print(f"option {option_id}: stored {stored}, actual {actual}")
+    print(f"{len(mismatches)} option counter(s) out of sync.")
+    return 1 if mismatches else 0
+
+
+def rebuild_counters(args):
+    fixed = 0
+    for session_factory in sharding.vote_session_factories(SessionLocal):
+        db = session_factory()
+        try:
+            fixed += counters.rebuild_vote_counts(db)
+            db.commit()
+        finally:
+            db.close()
+    print(f"Rebuilt vote counters; {fixed} option(s) corrected.")
+
+
+def repair_shards(args):
+    if sharding.shards is None:
+        print("Sharding is not enabled.")
+        return
+    db = SessionLocal()
+    try:
+        repaired = sharding.repair_options(db)
+    finally:
+        db.close()
+    print(f"Copied {repaired} missing option(s) to their shards.")
+
+
+def purge_polls(args):
+    purger = purge.Purger(SessionLocal)
+    pending = len(purger.pending())
+    purged = purger.purge_pending()
+    print(f"Purged {purged} of {pending} deleted poll(s).")
+
+
+def grant_admin(args):
+    db = SessionLocal()
+    try:
+        updated = db.query(User).filter(User.username == args.username).update(
+            {User.is_admin: not args.revoke}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
+    if not updated:
+        print(f"No such user: {args.username}")
+        return 1
+    action = "Revoked admin rights from" if args.revoke else "Granted admin rights to"
+    print(f"{action} {args.username}.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Polly-API maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="Create tables and apply migrations").set_defaults(
+        func=migrate
+    )
+    commands.add_parser(
+        "verify-counters", help="Compare option vote counters against the votes table"
+    ).set_defaults(func=verify_counters)
+    commands.add_parser(
+        "rebuild-counters", help="Recompute option vote counters from the votes table"
+    ).set_defaults(func=rebuild_counters)
+    commands.add_parser(
+        "repair-shards", help="Copy options missing from their shard after a failed poll creation"
+    ).set_defaults(func=repair_shards)
+    commands.add_parser(
+        "purge", help="Finish purging deleted polls now instead of in the background"
+    ).set_defaults(func=purge_polls)
+    grant = commands.add_parser(
+        "grant-admin",
+        help="Make a user an admin",
+        description="Make a user an admin. Running servers cache users, so the change "
+        "reaches them within POLLY_AUTH_CACHE_TTL seconds (default 60).",
+    )
+    grant.add_argument("username")
+    grant.add_argument("--revoke", action="store_true", help="Remove admin rights instead")
+    grant.set_defaults(func=grant_admin)
+    args = parser.parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
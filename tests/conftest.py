@@ -0,0 +1,71 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from dataclasses import dataclass
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from api import routes
+from api.database import Base, get_db, get_read_db
+
+
+@dataclass
+class ApiUnderTest:
+    """An app serving api.routes from its own SQLite file."""
+
+    path: str
+    engine: Engine
+    session_factory: sessionmaker
+    app: FastAPI
+
+
+@pytest.fixture(scope="module")
+def make_api():
+    """Factory fixture: ``make_api("journal")`` uses ./test_journal_polls.db.
+
+    The tables are created up front; they are dropped and the file removed
+    when the test module finishes.
+    """
+    created = []
+
+    def factory(name: str) -> ApiUnderTest:
+        path = f"./test_{name}_polls.db"
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        session_factory = sessionmaker(autoflush=False, bind=engine)
+
+        def override_get_db():
+            db = session_factory()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app = FastAPI()
+        app.include_router(routes.router)
+        app.dependency_overrides[get_db] = override_get_db
+        app.dependency_overrides[get_read_db] = override_get_db
+        Base.metadata.create_all(bind=engine)
+        created.append(ApiUnderTest(path, engine, session_factory, app))
+        return created[-1]
+
+    yield factory
+    for api in created:
+        Base.metadata.drop_all(bind=api.engine)
+        api.engine.dispose()
+        if os.path.exists(api.path):
+            os.remove(api.path)
+
+
+@pytest.fixture(scope="session")
+def login():
+    """``login(client, username, password)`` registers the user and returns auth headers."""
+
+    def login(client, username: str, password: str):
+        client.post("/register", json={"username": username, "password": password})
+        response = client.post("/login", data={"username": username, "password": password})
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    return login
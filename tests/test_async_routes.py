@@ -0,0 +1,254 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import functools
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from api import async_routes, export, results
+from api.models import Vote
+from api.votes import record_votes
+from api.database import Base, get_async_db, get_async_read_db
+
+
+# Use a separate test database for the async stack
+TEST_DATABASE_PATH = "./test_async_polls.db"
+engine = create_engine(f"sqlite:///{TEST_DATABASE_PATH}")
+TestingSessionLocal = sessionmaker(autoflush=False, bind=engine)
+async_engine = create_async_engine(f"sqlite+aiosqlite:///{TEST_DATABASE_PATH}")
+TestingAsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
+
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
+app = FastAPI()
+app.include_router(async_routes.router)
+app.dependency_overrides[get_async_db] = override_get_async_db
+app.dependency_overrides[get_async_read_db] = override_get_async_db
+
+
+@pytest.fixture(scope="module")
+def client():
+    Base.metadata.create_all(bind=engine)
+    with TestClient(app) as client:
+        yield client
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+    if os.path.exists(TEST_DATABASE_PATH):
+        os.remove(TEST_DATABASE_PATH)
+
+
+@pytest.fixture(scope="module")
+def headers(client, login):
+    return login(client, "asyncvoter", "asyncpass")
+
+
+@pytest.fixture(scope="module")
+def poll(client, headers):
+    """A poll with one vote from ``asyncvoter`` and three stored directly."""
+    poll = client.post(
+        "/polls", json={"question": "Async votes?", "options": ["Yes", "No"]},
+        headers=headers,
+    ).json()
+    yes, no = (option["id"] for option in poll["options"])
+    # Poll ids restart in every test database; drop entries cached by other modules
+    results.results_cache.clear()
+    client.post(f"/polls/{poll['id']}/vote", json={"option_id": yes}, headers=headers)
+    with TestingSessionLocal() as db:
+        record_votes(db, [(1000 + n, poll["id"], no) for n in range(3)])
+        db.commit()
+    return poll
+
+
+def test_async_poll_lifecycle(client):
+    response = client.post(
+        "/register", json={"username": "asyncuser", "password": "asyncpass"}
+    )
+    assert response.status_code == 200
+    response = client.post(
+        "/login", data={"username": "asyncuser", "password": "asyncpass"}
+    )
+    assert response.status_code == 200
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    response = client.post(
+        "/polls",
+        json={"question": "Async or sync?", "options": ["Async", "Sync"]},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    poll = response.json()
+    first, second = (option["id"] for option in poll["options"])
+
+    listed = client.get("/polls").json()
+    assert [p["id"] for p in listed] == [poll["id"]]
+    assert len(listed[0]["options"]) == 2
+
+    for option_id in (first, second):
+        response = client.post(
+            f"/polls/{poll['id']}/vote", json={"option_id": option_id}, headers=headers
+        )
+        assert response.status_code == 200
+        assert response.json()["option_id"] == option_id
+
+    results = client.get(f"/polls/{poll['id']}/results").json()["results"]
+    assert [r["vote_count"] for r in results] == [0, 1]
+
+    response = client.delete(f"/polls/{poll['id']}", headers=headers)
+    assert response.status_code == 204
+    assert client.get(f"/polls/{poll['id']}").status_code == 404
+
+
+def test_async_batch_vote(client, headers, poll):
+    yes, no = (option["id"] for option in poll["options"])
+    response = client.post(
+        "/votes/batch",
+        json={"votes": [
+            {"poll_id": poll["id"], "option_id": no},
+            {"poll_id": poll["id"], "option_id": 999999},
+            {"poll_id": poll["id"], "option_id": yes},
+        ]},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["recorded"] == 2
+    assert data["rejected"] == 1
+    assert [r["status"] for r in data["results"]] == ["superseded", "rejected", "recorded"]
+    counts = [
+        r["vote_count"] for r in client.get(f"/polls/{poll['id']}/results").json()["results"]
+    ]
+    assert counts == [1, 3]
+
+    # Only admins may vote on behalf of someone else
+    response = client.post(
+        "/votes/batch",
+        json={"votes": [{"poll_id": poll["id"], "option_id": yes, "user_id": 999}]},
+        headers=headers,
+    )
+    assert response.status_code == 403
+
+
+def test_async_batch_results(client, headers, poll):
+    other_poll = client.post(
+        "/polls", json={"question": "Coffee?", "options": ["Yes", "No"]}, headers=headers
+    ).json()["id"]
+    response = client.get(f"/polls/results?ids={poll['id']},999999,{other_poll},{poll['id']}")
+    assert response.status_code == 200
+    data = response.json()
+    assert [r["poll_id"] for r in data["results"]] == [poll["id"], other_poll]
+    assert data["missing"] == [999999]
+    assert data["results"][0] == client.get(f"/polls/{poll['id']}/results").json()
+
+    # Served from the per-poll cache, with a combined ETag
+    hits = results.results_cache.hits
+    cached = client.get(
+        f"/polls/results?ids={poll['id']},999999,{other_poll}",
+        headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert cached.status_code == 304
+    assert results.results_cache.hits == hits + 2
+
+    assert client.get("/polls/results?ids=1,x").status_code == 400
+    assert client.delete(f"/polls/{other_poll}", headers=headers).status_code == 204
+
+
+def test_async_results_timeseries(client, poll):
+    response = client.get(f"/polls/{poll['id']}/results/timeseries")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["poll_id"] == poll["id"]
+    assert data["bucket"] == "minute"
+    # Buckets hold net changes, so they sum to the current counts
+    totals = {}
+    for point in data["points"]:
+        totals[point["option_id"]] = totals.get(point["option_id"], 0) + point["votes"]
+    current = {
+        r["option_id"]: r["vote_count"]
+        for r in client.get(f"/polls/{poll['id']}/results").json()["results"]
+    }
+    assert totals == {k: v for k, v in current.items() if v}
+
+    assert client.get(
+        f"/polls/{poll['id']}/results/timeseries", params={"bucket": "day"}
+    ).status_code == 422
+    assert client.get(
+        f"/polls/{poll['id']}/results/timeseries",
+        params={"from": "2020-01-01T00:00:00Z", "to": "2020-02-01T00:00:00Z"},
+    ).status_code == 400
+    assert client.get("/polls/999999/results/timeseries").status_code == 404
+
+
+def test_async_export_votes(client, headers, poll, monkeypatch):
+    with TestingSessionLocal() as db:
+        stored = db.query(Vote.id, Vote.user_id, Vote.option_id).filter(
+            Vote.poll_id == poll["id"]
+        ).order_by(Vote.id).all()
+    assert len(stored) == 4
+    # One vote per chunk, so the body pulls every chunk through run_sync
+    monkeypatch.setattr(
+        export, "encode_chunks", functools.partial(export.encode_chunks, chunk=1)
+    )
+
+    url = f"/polls/{poll['id']}/votes/export"
+    response = client.get(url, headers={**headers, "Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["content-encoding"] == "gzip"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [(r["id"], r["user_id"], r["option_id"]) for r in rows] == [tuple(v) for v in stored]
+
+    # Resume after the first vote, uncompressed, as CSV
+    response = client.get(
+        url, params={"format": "csv", "after_id": stored[0][0]},
+        headers={**headers, "Accept-Encoding": "identity"},
+    )
+    assert "content-encoding" not in response.headers
+    lines = response.text.splitlines()
+    assert lines[0] == "id,user_id,option_id,created_at"
+    assert [tuple(map(int, line.split(",")[:3])) for line in lines[1:]] == [
+        tuple(v) for v in stored[1:]
+    ]
+
+    assert client.get(url).status_code == 401
+    assert client.get("/polls/999999/votes/export", headers=headers).status_code == 404
+
+
+def test_async_search_polls(client, headers):
+    questions = [
+        ("Favourite async framework?", ["Trio", "Asyncio"]),
+        ("Best framework for scripting?", ["Trio", "Click"]),
+    ]
+    created = [
+        client.post(
+            "/polls", json={"question": question, "options": options}, headers=headers
+        ).json()["id"]
+        for question, options in questions
+    ]
+
+    # Prefix match on the last word; a question match outranks an option match
+    response = client.get("/polls/search", params={"q": "framewor"})
+    assert response.status_code == 200
+    assert [p["id"] for p in response.json()] == created
+    response = client.get("/polls/search", params={"q": "trio script"})
+    assert [p["id"] for p in response.json()] == [created[1]]
+    assert client.get("/polls/search", params={"q": "?!"}).status_code == 400
+
+    first_page = client.get("/polls/search", params={"q": "trio", "limit": 1})
+    cursor = first_page.headers["X-Next-Cursor"]
+    second_page = client.get("/polls/search", params={"q": "trio", "limit": 1, "after": cursor})
+    assert {first_page.json()[0]["id"], second_page.json()[0]["id"]} == set(created)
+
+    for poll_id in created:
+        client.delete(f"/polls/{poll_id}", headers=headers)
+    assert client.get("/polls/search", params={"q": "trio"}).json() == []
@@ -0,0 +1,80 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import asyncio
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from client import AsyncPollyClient, PollyAPIError, PollyClient
+
+
+@pytest.fixture(scope="module")
+def app(make_api):
+    return make_api("client").app
+
+
+def test_sync_client_relogs_in_on_401(app):
+    with PollyClient(http_client=TestClient(app)) as polly:
+        polly.register("sdkuser", "sdkpass")
+        polly.login("sdkuser", "sdkpass")
+        poll = polly.create_poll("Pooled?", ["Yes", "No"])
+
+        # An expired or revoked token is replaced transparently
+        polly.token = "not-a-valid-token"
+        vote = polly.vote(poll["id"], poll["options"][1]["id"])
+        assert vote["option_id"] == poll["options"][1]["id"]
+        assert polly.token != "not-a-valid-token"
+
+        results = polly.get_poll_results(poll["id"])
+        assert [option["vote_count"] for option in results["results"]] == [0, 1]
+        assert [p["id"] for p in polly.iter_polls(page_size=1)] == [poll["id"]]
+
+        with pytest.raises(PollyAPIError) as excinfo:
+            polly.get_poll(999999)
+        assert excinfo.value.status_code == 404
+
+
+def test_async_client_votes_concurrently(app):
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        http = httpx.AsyncClient(transport=transport, base_url="http://polly")
+        async with AsyncPollyClient(http_client=http, pool_size=4) as polly:
+            await polly.register("asyncsdk", "sdkpass")
+            await polly.login("asyncsdk", "sdkpass")
+            polls = [await polly.create_poll(f"Q{i}?", ["A", "B"]) for i in range(5)]
+            outcomes = await polly.vote_many(
+                [(poll["id"], poll["options"][0]["id"]) for poll in polls]
+                + [(999999, 1)]
+            )
+            results = await polly.get_poll_results(polls[0]["id"])
+        return polls, outcomes, results
+
+    polls, outcomes, results = asyncio.run(scenario())
+    assert [vote["option_id"] for vote in outcomes[:-1]] == [
+        poll["options"][0]["id"] for poll in polls
+    ]
+    assert isinstance(outcomes[-1], PollyAPIError)
+    assert outcomes[-1].status_code == 404
+    assert results["results"][0]["vote_count"] == 1
+
+
+def test_idempotent_calls_are_retried():
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        if len(calls) < 3:
+            return httpx.Response(503, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"id": 1})
+
+    http = httpx.Client(transport=httpx.MockTransport(handler), base_url="http://polly")
+    with PollyClient(http_client=http, backoff=0) as polly:
+        assert polly.get_poll(1) == {"id": 1}
+        assert calls == ["GET"] * 3
+
+        # Creating a poll is not idempotent and fails on the first 503
+        calls.clear()
+        with pytest.raises(PollyAPIError):
+            polly.create_poll("Again?", ["Yes", "No"])
+        assert calls == ["POST"]
@@ -0,0 +1,30 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from api.database import apply_production_profile
+
+
+def test_production_profile_pragmas(tmp_path):
+    url = f"sqlite:///{tmp_path / 'profile.db'}"
+    writer = create_engine(url, pool_size=1, max_overflow=0)
+    reader = create_engine(url)
+    apply_production_profile(writer)
+    apply_production_profile(reader, read_only=True)
+    try:
+        with writer.begin() as conn:
+            assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+            assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+            assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == 5000
+            conn.exec_driver_sql("CREATE TABLE t (x INTEGER)")
+            conn.exec_driver_sql("INSERT INTO t VALUES (1)")
+        with reader.connect() as conn:
+            assert conn.exec_driver_sql("SELECT count(*) FROM t").scalar() == 1
+            with pytest.raises(OperationalError):
+                conn.exec_driver_sql("INSERT INTO t VALUES (2)")
+    finally:
+        writer.dispose()
+        reader.dispose()
@@ -0,0 +1,110 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import pytest
+from fastapi.testclient import TestClient
+from api import journal, results
+from api.journal import RECORD, VoteJournal
+from api.models import JournalCheckpoint, Vote
+
+
+@pytest.fixture(scope="module")
+def api(make_api):
+    return make_api("journal")
+
+
+@pytest.fixture(scope="module")
+def client(api):
+    return TestClient(api.app)
+
+
+@pytest.fixture(scope="module")
+def headers(client, login):
+    return login(client, "journaluser", "journalpass")
+
+
+def _create_poll(client, headers):
+    return client.post(
+        "/polls", json={"question": "Journaled?", "options": ["Yes", "No"]}, headers=headers
+    ).json()
+
+
+def _counts(client, poll_id):
+    return [r["vote_count"] for r in client.get(f"/polls/{poll_id}/results").json()["results"]]
+
+
+def _stored_votes(api, poll_id):
+    with api.session_factory() as db:
+        return db.query(Vote.option_id).filter(Vote.poll_id == poll_id).all()
+
+
+def test_journaled_votes_are_merged_into_results(api, client, headers, tmp_path):
+    poll = _create_poll(client, headers)
+    yes, no = (option["id"] for option in poll["options"])
+    vote_journal = journal.start_journal(
+        api.session_factory, directory=str(tmp_path), fsync_ms=1, compact_ms=3_600_000
+    )
+    try:
+        response = client.post(
+            f"/polls/{poll['id']}/vote", json={"option_id": yes}, headers=headers
+        )
+        assert response.status_code == 202
+        assert response.json()["status"] == "accepted"
+        # Not compacted yet, but already counted
+        assert _stored_votes(api, poll["id"]) == []
+        assert _counts(client, poll["id"]) == [1, 0]
+
+        assert vote_journal.compact() == 1
+        assert _stored_votes(api, poll["id"]) == [(yes,)]
+        assert vote_journal.pending_votes(poll["id"]) is None
+
+        # A pending vote moves the compacted one
+        client.post(f"/polls/{poll['id']}/vote", json={"option_id": no}, headers=headers)
+        assert _counts(client, poll["id"]) == [0, 1]
+        assert vote_journal.compact() == 1
+        results.invalidate(poll["id"])
+        assert _counts(client, poll["id"]) == [0, 1]
+    finally:
+        journal.stop_journal()
+    assert os.listdir(tmp_path) == []
+
+
+def test_journal_replays_after_crash(api, client, headers, tmp_path):
+    poll = _create_poll(client, headers)
+    yes, no = (option["id"] for option in poll["options"])
+    with api.session_factory() as db:
+        user_ids = [db.query(Vote.user_id).count() + n for n in (100, 101, 102)]
+
+    crashed = VoteJournal(
+        api.session_factory, directory=str(tmp_path), segment_records=2,
+        fsync_ms=1, compact_ms=3_600_000,
+    )
+    crashed.start()
+    for user_id, option_id in zip(user_ids, (yes, no, no)):
+        crashed.append(user_id, poll["id"], option_id).result(timeout=5)
+    # Simulate a crash: the threads stop, nothing is compacted or cleaned up
+    crashed._stopping.set()
+    for thread in crashed._threads:
+        thread.join()
+
+    # The second segment holds the third vote; tear its record
+    segments = sorted(os.listdir(tmp_path))
+    with open(tmp_path / segments[-1], "r+b") as segment:
+        segment.seek(RECORD.size // 2)
+        segment.write(b"\xff" * 4)
+
+    recovered = VoteJournal(api.session_factory, directory=str(tmp_path))
+    recovered.start()
+    try:
+        assert sorted(_stored_votes(api, poll["id"])) == sorted([(yes,), (no,)])
+        with api.session_factory() as db:
+            checkpoint = db.get(JournalCheckpoint, 1)
+            # Numbering continues from the checkpoint: past the first segment's two votes
+            first_segment = int(segments[0].removeprefix("votes-").removesuffix(".seg"))
+            assert (checkpoint.segment, checkpoint.position) == (first_segment, 2)
+        results.invalidate(poll["id"])
+        assert _counts(client, poll["id"]) == [1, 1]
+    finally:
+        recovered.stop()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,52 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from sqlalchemy import create_engine
+from api import migrations
+
+# Schema as shipped before migrations existed (user_version 0)
+LEGACY_SCHEMA = [
+    "CREATE TABLE users (id INTEGER NOT NULL PRIMARY KEY, username VARCHAR, hashed_password VARCHAR)",
+    "CREATE TABLE polls (id INTEGER NOT NULL PRIMARY KEY, question VARCHAR, created_at DATETIME, owner_id INTEGER REFERENCES users (id))",
+    "CREATE TABLE options (id INTEGER NOT NULL PRIMARY KEY, text VARCHAR, poll_id INTEGER REFERENCES polls (id))",
+    "CREATE TABLE votes (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER REFERENCES users (id), option_id INTEGER REFERENCES options (id), created_at DATETIME)",
+]
+
+
+def test_upgrade_legacy_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql("INSERT INTO users VALUES (1, 'alice', 'x'), (2, 'bob', 'x')")
+        conn.exec_driver_sql("INSERT INTO polls VALUES (1, 'Tea?', NULL, 1)")
+        conn.exec_driver_sql("INSERT INTO options VALUES (1, 'Yes', 1), (2, 'No', 1)")
+        # alice raced herself into two votes; the later one must survive
+        conn.exec_driver_sql(
+            "INSERT INTO votes VALUES (1, 1, 1, NULL), (2, 1, 2, NULL), "
+            "(3, 2, 2, '2024-05-01 12:34:56.789000')"
+        )
+
+    migrations.upgrade(engine)
+
+    with engine.connect() as conn:
+        assert migrations.get_schema_version(conn) == migrations.SCHEMA_VERSION
+        votes = conn.exec_driver_sql(
+            "SELECT id, user_id, poll_id, option_id FROM votes ORDER BY id"
+        ).all()
+        assert votes == [(2, 1, 1, 2), (3, 2, 1, 2)]
+        counts = conn.exec_driver_sql(
+            "SELECT id, vote_count FROM options ORDER BY id"
+        ).all()
+        assert counts == [(1, 0), (2, 2)]
+        assert conn.exec_driver_sql(
+            "SELECT rowid FROM polls_fts WHERE polls_fts MATCH 'tea'"
+        ).all() == [(1,)]
+        # Only votes with a timestamp can be placed in a bucket
+        rollups = conn.exec_driver_sql(
+            "SELECT resolution, bucket_start, option_id, votes FROM vote_rollups "
+            "ORDER BY resolution"
+        ).all()
+        assert rollups == [(60, 1714566840, 2, 1), (3600, 1714564800, 2, 1)]
+    engine.dispose()
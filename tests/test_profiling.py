@@ -0,0 +1,89 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import threading
+import time
+import pytest
+from fastapi.testclient import TestClient
+from api import auth
+from api.cache import TTLCache
+from api.models import User
+from api.profiling import ProfilingMiddleware, StackSampler
+
+
+@pytest.fixture(scope="module")
+def profile_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp("profiles")
+
+
+@pytest.fixture(scope="module")
+def api(make_api, profile_dir):
+    api = make_api("profiling")
+    api.app.add_middleware(
+        ProfilingMiddleware, session_factory=api.session_factory, directory=str(profile_dir)
+    )
+    return api
+
+
+@pytest.fixture(scope="module")
+def client(api):
+    return TestClient(api.app)
+
+
+def _token(client, api, username, admin=False):
+    client.post("/register", json={"username": username, "password": "profilepass"})
+    if admin:
+        with api.session_factory() as db:
+            db.query(User).filter(User.username == username).update({User.is_admin: True})
+            db.commit()
+    response = client.post("/login", data={"username": username, "password": "profilepass"})
+    return response.json()["access_token"]
+
+
+def test_only_admins_can_request_a_profile(client, api, profile_dir):
+    user_headers = {"Authorization": f"Bearer {_token(client, api, 'profileuser')}"}
+    admin_headers = {
+        "Authorization": f"Bearer {_token(client, api, 'profileadmin', admin=True)}"
+    }
+    auth.principal_cache.clear()
+
+    response = client.get("/polls", headers={**user_headers, "X-Polly-Profile": "1"})
+    assert response.status_code == 200
+    assert "X-Polly-Profile" not in response.headers
+    assert client.get("/polls", headers={"X-Polly-Profile": "1"}).headers.get(
+        "X-Polly-Profile"
+    ) is None
+    assert list(profile_dir.iterdir()) == []
+
+    response = client.get("/polls?profile=1", headers=admin_headers)
+    assert response.status_code == 200
+    profile = profile_dir / response.headers["X-Polly-Profile"]
+    assert profile.exists()
+    for line in profile.read_text().splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert stack and int(count) > 0
+
+
+def test_stack_sampler_collapses_app_stacks():
+    cache = TTLCache(maxsize=10, ttl=60)
+    stop = threading.Event()
+
+    def busy():
+        while not stop.is_set():
+            cache.get("key")
+
+    worker = threading.Thread(target=busy, name="busy-worker")
+    sampler = StackSampler(interval_ms=1)
+    worker.start()
+    sampler.start()
+    time.sleep(0.2)
+    sampler.stop()
+    stop.set()
+    worker.join()
+
+    stacks = sampler.collapsed().splitlines()
+    assert any(
+        line.startswith("busy-worker;") and "api/cache.py:TTLCache.get" in line
+        for line in stacks
+    )
@@ -0,0 +1,94 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from api import counters, purge
+from api.models import Option, PollPurge, Vote, VoteRollup
+from api.votes import record_votes
+
+
+@pytest.fixture(scope="module")
+def api(make_api):
+    return make_api("purge")
+
+
+@pytest.fixture(scope="module")
+def client(api):
+    return TestClient(api.app)
+
+
+@pytest.fixture(scope="module")
+def headers(client, login):
+    return login(client, "purgeuser", "purgepass")
+
+
+def _poll_with_votes(api, client, headers, voters):
+    poll = client.post(
+        "/polls", json={"question": "Purge me?", "options": ["Yes", "No"]}, headers=headers
+    ).json()
+    yes, no = (option["id"] for option in poll["options"])
+    with api.session_factory() as db:
+        record_votes(db, [
+            (1000 + n, poll["id"], yes if n % 3 else no) for n in range(voters)
+        ])
+        db.commit()
+    return poll["id"]
+
+
+def _leftovers(api, poll_id):
+    with api.session_factory() as db:
+        return (
+            db.query(Option).filter(Option.poll_id == poll_id).count(),
+            db.query(Vote).filter(Vote.poll_id == poll_id).count(),
+            db.query(VoteRollup).filter(VoteRollup.poll_id == poll_id).count(),
+        )
+
+
+def test_delete_poll_uses_bulk_statements(api, client, headers):
+    poll_id = _poll_with_votes(api, client, headers, 10)
+    statements = []
+    collect = lambda *args: statements.append(args[2])
+    event.listen(api.engine, "before_cursor_execute", collect)
+    try:
+        response = client.delete(f"/polls/{poll_id}", headers=headers)
+    finally:
+        event.remove(api.engine, "before_cursor_execute", collect)
+    assert response.status_code == 204
+    assert _leftovers(api, poll_id) == (0, 0, 0)
+    # Nothing loads the votes; each table is cleared by one statement
+    assert not any(s.startswith("SELECT votes") for s in statements)
+    assert sum(s.startswith("DELETE FROM votes") for s in statements) == 1
+    assert client.get(f"/polls/{poll_id}").status_code == 404
+
+
+def test_large_poll_is_purged_in_batches(api, client, headers, monkeypatch):
+    monkeypatch.setattr(purge, "PURGE_THRESHOLD", 5)
+    poll_id = _poll_with_votes(api, client, headers, 12)
+    yes = client.get(f"/polls/{poll_id}").json()["options"][0]["id"]
+
+    assert client.delete(f"/polls/{poll_id}", headers=headers).status_code == 204
+    # Gone for readers and voters at once, purged later
+    assert client.get(f"/polls/{poll_id}").status_code == 404
+    assert client.get(f"/polls/{poll_id}/results").status_code == 404
+    batch = client.post(
+        "/votes/batch", json={"votes": [{"poll_id": poll_id, "option_id": yes}]},
+        headers=headers,
+    )
+    assert batch.json()["results"][0]["detail"] == "Poll not found"
+    assert _leftovers(api, poll_id)[:2] == (2, 12)
+
+    with api.session_factory() as db:
+        assert not purge.purge_batch(db, poll_id, limit=3)
+        db.commit()
+        # Counters follow the deleted votes
+        assert counters.verify_vote_counts(db) == []
+
+    purger = purge.Purger(api.session_factory, batch=3, pause_ms=0)
+    assert purger.pending() == [poll_id]
+    assert purger.purge_pending() == 1
+    assert _leftovers(api, poll_id) == (0, 0, 0)
+    with api.session_factory() as db:
+        assert db.query(PollPurge).count() == 0
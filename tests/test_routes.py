@@ -2,12 +2,21 @@ import os
 import sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import asyncio
+import json
+import threading
+import time
 import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
-from api.database import Base, get_db
-from api.models import User, Poll
+from passlib.context import CryptContext
+from api.database import Base, get_db, get_read_db
+from api import (
+    auth, counters, export, hashing, ratelimit, results, serialization, streaming, votes,
+)
+from api.models import User, Poll, Vote
 from api.schemas import UserCreate, PollCreate
 from main import app
 
@@ -30,6 +39,7 @@ def override_get_db():
 
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 
 
 @pytest.fixture(scope="module", autouse=True)
@@ -68,6 +78,64 @@ def test_login():
     token = data["access_token"]
 
 
+def test_login_rehashes_outdated_cost():
+    cheap_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("oldpass")
+    db = TestingSessionLocal()
+    try:
+        db.add(User(username="legacyuser", hashed_password=cheap_hash))
+        db.commit()
+    finally:
+        db.close()
+    response = client.post(
+        "/login", data={"username": "legacyuser", "password": "oldpass"}
+    )
+    assert response.status_code == 200
+    db = TestingSessionLocal()
+    try:
+        stored = db.query(User).filter(User.username == "legacyuser").one()
+        assert stored.hashed_password != cheap_hash
+        assert not hashing.pwd_context().needs_update(stored.hashed_password)
+    finally:
+        db.close()
+
+
+def test_password_hashing_admission_control(monkeypatch):
+    monkeypatch.setattr(hashing, "_slots", threading.BoundedSemaphore(1))
+    hashing._slots.acquire()
+    response = client.post(
+        "/login", data={"username": "testuser", "password": "testpass"}
+    )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == hashing.HASH_RETRY_AFTER
+
+
+def test_principal_cache():
+    headers = {"Authorization": f"Bearer {token}"}
+    auth.invalidate_user("testuser")
+    statements = []
+    count = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        user_misses = auth.principal_cache.misses
+        assert client.delete("/polls/999999", headers=headers).status_code == 404
+        assert auth.principal_cache.misses == user_misses + 1
+        lookups = len(statements)
+
+        user_hits = auth.principal_cache.hits
+        token_hits = auth.token_cache.hits
+        assert client.delete("/polls/999999", headers=headers).status_code == 404
+        assert auth.principal_cache.hits == user_hits + 1
+        assert auth.token_cache.hits == token_hits + 1
+        # The cached request skips the SELECT on users
+        assert len(statements) == lookups + 1
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    auth.invalidate_user("testuser")
+    assert auth.principal_cache.get("testuser") is None
+    assert auth.token_cache.get(token) is None
+
+
 def test_get_polls_empty():
     response = client.get("/polls")
     assert response.status_code == 200
@@ -96,6 +164,8 @@ def test_create_poll():
     poll_id = data["id"]
     global option_id
     option_id = data["options"][0]["id"]
+    global other_option_id
+    other_option_id = data["options"][1]["id"]
 
 
 def test_get_polls_with_data():
@@ -132,6 +202,380 @@ def test_get_poll_results():
     assert data["results"][0]["vote_count"] == 1
 
 
+def test_poll_results_etag():
+    first = client.get(f"/polls/{poll_id}/results")
+    etag = first.headers["ETag"]
+
+    statements = []
+    count = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        hits = results.results_cache.hits
+        cached = client.get(
+            f"/polls/{poll_id}/results", headers={"If-None-Match": etag}
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert statements == []
+    assert results.results_cache.hits == hits + 1
+
+
+def test_poll_results_etag_on_cache_miss():
+    etag = client.get(f"/polls/{poll_id}/results").headers["ETag"]
+    results.invalidate(poll_id)
+
+    statements = []
+    count = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        cached = client.get(f"/polls/{poll_id}/results", headers={"If-None-Match": etag})
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+    # Only the poll row and the counters are read; nothing is cached without a body
+    assert not any("options.text" in statement for statement in statements)
+    assert results.lookup(poll_id) is None
+
+    stale = client.get(f"/polls/{poll_id}/results", headers={"If-None-Match": '"stale"'})
+    assert stale.status_code == 200
+    assert stale.headers["ETag"] == etag
+    assert client.get(
+        "/polls/999999/results", headers={"If-None-Match": etag}
+    ).status_code == 404
+
+
+def test_results_cache_counts_each_miss_once():
+    # The async routes and the stream probe with lookup before loading
+    results.invalidate(poll_id)
+    misses = results.results_cache.misses
+    assert results.lookup(poll_id) is None
+    db = TestingSessionLocal()
+    try:
+        assert results.load(db, poll_id) is not None
+    finally:
+        db.close()
+    assert results.results_cache.misses == misses + 1
+
+
+def test_change_vote_moves_count():
+    headers = {"Authorization": f"Bearer {token}"}
+    old_etag = client.get(f"/polls/{poll_id}/results").headers["ETag"]
+    response = client.post(
+        f"/polls/{poll_id}/vote",
+        json={"option_id": other_option_id},
+        headers=headers
+    )
+    assert response.status_code == 200
+    # The vote invalidated the cached results and their ETag
+    response = client.get(
+        f"/polls/{poll_id}/results", headers={"If-None-Match": old_etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != old_etag
+    counts = {r["option_id"]: r["vote_count"] for r in response.json()["results"]}
+    assert counts == {option_id: 0, other_option_id: 1}
+
+
+def test_results_timeseries():
+    response = client.get(f"/polls/{poll_id}/results/timeseries")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["poll_id"] == poll_id
+    assert data["bucket"] == "minute"
+    assert data["from"] < data["to"]
+    # Buckets hold net changes, so they sum to the current counts
+    totals = {}
+    for point in data["points"]:
+        totals[point["option_id"]] = totals.get(point["option_id"], 0) + point["votes"]
+    assert {k: v for k, v in totals.items() if v} == {other_option_id: 1}
+
+    hourly = client.get(f"/polls/{poll_id}/results/timeseries", params={"bucket": "hour"})
+    assert sum(p["votes"] for p in hourly.json()["points"]) == 1
+    assert client.get(
+        f"/polls/{poll_id}/results/timeseries", params={"bucket": "day"}
+    ).status_code == 422
+    assert client.get(
+        f"/polls/{poll_id}/results/timeseries",
+        params={"from": "2020-01-01T00:00:00Z", "to": "2020-02-01T00:00:00Z"},
+    ).status_code == 400
+    assert client.get("/polls/999999/results/timeseries").status_code == 404
+
+
+def test_batch_results():
+    headers = {"Authorization": f"Bearer {token}"}
+    other_poll = client.post(
+        "/polls", json={"question": "Coffee?", "options": ["Yes", "No"]}, headers=headers
+    ).json()["id"]
+    results.invalidate(poll_id)
+    results.invalidate(other_poll)
+
+    statements = []
+    collect = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", collect)
+    try:
+        response = client.get(f"/polls/results?ids={poll_id},999999,{other_poll},{poll_id}")
+    finally:
+        event.remove(engine, "before_cursor_execute", collect)
+    assert response.status_code == 200
+    data = response.json()
+    # One poll query and one options query for every cache miss together
+    assert len([s for s in statements if s.startswith("SELECT")]) == 2
+    assert [r["poll_id"] for r in data["results"]] == [poll_id, other_poll]
+    assert data["missing"] == [999999]
+    assert data["results"][0] == client.get(f"/polls/{poll_id}/results").json()
+
+    # Served from the per-poll cache, with a combined ETag
+    hits = results.results_cache.hits
+    cached = client.get(
+        f"/polls/results?ids={poll_id},999999,{other_poll}",
+        headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert cached.status_code == 304
+    assert results.results_cache.hits == hits + 2
+
+    # After a miss the combined ETag is rebuilt from the counters alone
+    results.invalidate(other_poll)
+    statements.clear()
+    event.listen(engine, "before_cursor_execute", collect)
+    try:
+        cached = client.get(
+            f"/polls/results?ids={poll_id},999999,{other_poll}",
+            headers={"If-None-Match": response.headers["ETag"]},
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", collect)
+    assert cached.status_code == 304
+    assert not any("options.text" in statement for statement in statements)
+
+    assert client.get("/polls/results?ids=1,x").status_code == 400
+    assert client.get("/polls/results?ids=").status_code == 400
+    assert client.delete(f"/polls/{other_poll}", headers=headers).status_code == 204
+
+
+def test_rebuild_vote_counts():
+    db = TestingSessionLocal()
+    try:
+        assert counters.verify_vote_counts(db) == []
+        counters.adjust_vote_count(db, option_id, 5)
+        db.commit()
+        assert counters.verify_vote_counts(db) == [(option_id, 5, 0)]
+        assert counters.rebuild_vote_counts(db) == 1
+        db.commit()
+        assert counters.verify_vote_counts(db) == []
+    finally:
+        db.close()
+
+
+def test_group_commit_vote():
+    writer = votes.VoteWriter(TestingSessionLocal, interval_ms=50)
+    writer.start()
+    app.dependency_overrides[votes.get_vote_writer] = lambda: writer
+    headers = {"Authorization": f"Bearer {token}"}
+    try:
+        accepted = client.post(
+            f"/polls/{poll_id}/vote?wait=false",
+            json={"option_id": option_id},
+            headers=headers
+        )
+        assert accepted.status_code == 202
+        assert accepted.json()["status"] == "accepted"
+        durable = client.post(
+            f"/polls/{poll_id}/vote",
+            json={"option_id": other_option_id},
+            headers=headers
+        )
+        assert durable.status_code == 200
+        assert durable.json()["option_id"] == other_option_id
+    finally:
+        writer.stop()
+        del app.dependency_overrides[votes.get_vote_writer]
+    counts = {
+        r["option_id"]: r["vote_count"]
+        for r in client.get(f"/polls/{poll_id}/results").json()["results"]
+    }
+    assert counts == {option_id: 0, other_option_id: 1}
+
+
+def test_group_commit_drops_votes_on_deleted_polls():
+    headers = {"Authorization": f"Bearer {token}"}
+    doomed = client.post(
+        "/polls", json={"question": "Gone before flush?", "options": ["A", "B"]},
+        headers=headers
+    ).json()
+    writer = votes.VoteWriter(TestingSessionLocal, interval_ms=0)
+    # Queued before the delete, flushed after it
+    dropped = writer.submit(1, doomed["id"], doomed["options"][0]["id"])
+    kept = writer.submit(1, poll_id, option_id)
+    assert client.delete(f"/polls/{doomed['id']}", headers=headers).status_code == 204
+    writer.start()
+    writer.stop()
+    with pytest.raises(HTTPException) as excinfo:
+        dropped.result()
+    assert excinfo.value.status_code == 404
+    assert kept.result().option_id == option_id
+    db = TestingSessionLocal()
+    try:
+        assert db.query(Vote).filter(Vote.poll_id == doomed["id"]).count() == 0
+        assert counters.verify_vote_counts(db) == []
+    finally:
+        db.close()
+    # Put the vote back where test_group_commit_vote left it
+    client.post(f"/polls/{poll_id}/vote", json={"option_id": other_option_id}, headers=headers)
+
+
+def test_batch_vote():
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.post(
+        "/votes/batch",
+        json={"votes": [
+            {"poll_id": poll_id, "option_id": option_id},
+            {"poll_id": poll_id, "option_id": 999999},
+            {"poll_id": poll_id, "option_id": other_option_id},
+        ]},
+        headers=headers
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["recorded"] == 2
+    assert data["rejected"] == 1
+    assert [r["status"] for r in data["results"]] == ["superseded", "rejected", "recorded"]
+    counts = {
+        r["option_id"]: r["vote_count"]
+        for r in client.get(f"/polls/{poll_id}/results").json()["results"]
+    }
+    assert counts == {option_id: 0, other_option_id: 1}
+
+    # Only admins may vote on behalf of someone else
+    response = client.post(
+        "/votes/batch",
+        json={"votes": [{"poll_id": poll_id, "option_id": option_id, "user_id": 999}]},
+        headers=headers
+    )
+    assert response.status_code == 403
+
+
+def test_batch_vote_on_behalf_as_admin():
+    db = TestingSessionLocal()
+    try:
+        db.query(User).filter(User.username == "testuser").update({User.is_admin: True})
+        db.commit()
+        voter_id = db.query(User.id).filter(User.username == "legacyuser").scalar()
+    finally:
+        db.close()
+    auth.invalidate_user("testuser")
+    headers = {"Authorization": f"Bearer {token}"}
+    try:
+        response = client.post(
+            "/votes/batch",
+            json={"votes": [
+                {"poll_id": poll_id, "option_id": option_id, "user_id": voter_id},
+                {"poll_id": poll_id, "option_id": option_id, "user_id": 999999},
+            ]},
+            headers=headers
+        )
+    finally:
+        db = TestingSessionLocal()
+        db.query(User).filter(User.username == "testuser").update({User.is_admin: False})
+        db.commit()
+        db.close()
+        auth.invalidate_user("testuser")
+    assert response.status_code == 200
+    assert [r["status"] for r in response.json()["results"]] == ["recorded", "rejected"]
+    counts = {
+        r["option_id"]: r["vote_count"]
+        for r in client.get(f"/polls/{poll_id}/results").json()["results"]
+    }
+    assert counts == {option_id: 1, other_option_id: 1}
+
+
+def test_results_stream_coalesces_updates():
+    broadcaster = streaming.ResultsBroadcaster(TestingSessionLocal, interval_ms=50)
+
+    async def scenario():
+        queue = broadcaster.subscribe(poll_id)
+        initial = await broadcaster.snapshot(poll_id)
+        stream = broadcaster.events(poll_id, queue, initial)
+        assert (await stream.__anext__()).startswith(f"id: {initial.etag}")
+        # A burst of changes produces a single broadcast
+        for _ in range(10):
+            await asyncio.to_thread(broadcaster.notify, poll_id)
+        frame = await asyncio.wait_for(stream.__anext__(), timeout=1)
+        assert "event: results" in frame
+        assert broadcaster.broadcasts == 1
+        await stream.aclose()
+        assert broadcaster.subscriber_count() == 0
+
+    asyncio.run(scenario())
+    assert client.get("/polls/999999/results/stream").status_code == 404
+
+
+def test_export_votes():
+    headers = {"Authorization": f"Bearer {token}"}
+    db = TestingSessionLocal()
+    try:
+        stored = db.query(Vote.id, Vote.user_id, Vote.option_id).filter(
+            Vote.poll_id == poll_id
+        ).order_by(Vote.id).all()
+        # Chunks hold at most `chunk` votes; CSV leads with the header
+        chunks = list(export.encode_chunks(db, poll_id, "csv", chunk=1))
+        assert len(chunks) == len(stored)
+        assert chunks[0].startswith(b"id,user_id,option_id,created_at\n")
+
+        # The poll's two option streams share the chunk rather than each buffering
+        # it (SQLite renders "LIMIT ? OFFSET ?", so the limit is the next-to-last)
+        limits = []
+        spy = lambda conn, cursor, statement, params, *args: (
+            limits.append(params[-2]) if "FROM votes" in statement else None
+        )
+        event.listen(engine, "before_cursor_execute", spy)
+        try:
+            list(export.iter_votes(db, poll_id, chunk=4))
+        finally:
+            event.remove(engine, "before_cursor_execute", spy)
+        assert limits and set(limits) == {2}
+    finally:
+        db.close()
+    assert len(stored) >= 2
+
+    url = f"/polls/{poll_id}/votes/export"
+    response = client.get(url, headers={**headers, "Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["content-encoding"] == "gzip"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [(r["id"], r["user_id"], r["option_id"]) for r in rows] == [tuple(v) for v in stored]
+
+    # Resume after the first vote, uncompressed, as CSV
+    response = client.get(
+        url, params={"format": "csv", "after_id": stored[0][0]},
+        headers={**headers, "Accept-Encoding": "identity"},
+    )
+    assert "content-encoding" not in response.headers
+    lines = response.text.splitlines()
+    assert lines[0] == "id,user_id,option_id,created_at"
+    assert [tuple(map(int, line.split(",")[:3])) for line in lines[1:]] == [
+        tuple(v) for v in stored[1:]
+    ]
+
+    # A principal cache miss is resolved on a reader: the stream never pins the writer
+    def no_writer():
+        raise AssertionError("the export must not open a writer session")
+        yield
+
+    auth.principal_cache.clear()
+    app.dependency_overrides[get_db] = no_writer
+    try:
+        assert client.get(url, headers=headers).status_code == 200
+    finally:
+        app.dependency_overrides[get_db] = override_get_db
+
+    assert client.get(url).status_code == 401
+    assert client.get("/polls/999999/votes/export", headers=headers).status_code == 404
+
+
 def test_delete_poll():
     headers = {"Authorization": f"Bearer {token}"}
     response = client.delete(f"/polls/{poll_id}", headers=headers)
@@ -142,3 +586,168 @@ def test_get_polls_after_delete():
     response = client.get("/polls")
     assert response.status_code == 200
     assert response.json() == []
+
+
+def test_get_polls_keyset_pagination():
+    headers = {"Authorization": f"Bearer {token}"}
+    created = [
+        client.post(
+            "/polls",
+            json={"question": f"Page poll {i}", "options": ["A", "B"]},
+            headers=headers
+        ).json()["id"]
+        for i in range(3)
+    ]
+
+    statements = []
+    count = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        first_page = client.get("/polls?limit=2")
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert [p["id"] for p in first_page.json()] == created[:2]
+    assert all(len(p["options"]) == 2 for p in first_page.json())
+    # One query for the polls and one for all of their options
+    assert len(statements) == 2
+
+    cursor = first_page.headers["X-Next-Cursor"]
+    second_page = client.get(f"/polls?limit=2&after={cursor}")
+    assert [p["id"] for p in second_page.json()] == created[2:]
+    assert "X-Next-Cursor" not in second_page.headers
+
+    assert client.get("/polls?after=not-a-cursor").status_code == 400
+
+
+def test_search_polls():
+    headers = {"Authorization": f"Bearer {token}"}
+    questions = [
+        ("Favourite programming language?", ["Python", "Rust"]),
+        ("Best language for scripting?", ["Python", "Perl"]),
+        ("Tabs or spaces?", ["Tabs", "Spaces"]),
+    ]
+    created = [
+        client.post(
+            "/polls", json={"question": question, "options": options}, headers=headers
+        ).json()["id"]
+        for question, options in questions
+    ]
+
+    # Prefix match on the last word; a question match outranks an option match
+    response = client.get("/polls/search", params={"q": "languag"})
+    assert response.status_code == 200
+    assert [p["id"] for p in response.json()] == created[:2]
+    response = client.get("/polls/search", params={"q": "python script"})
+    assert [p["id"] for p in response.json()] == [created[1]]
+    assert client.get("/polls/search", params={"q": "pyth"}).json()[0]["options"]
+    # FTS5 syntax is searched for literally
+    assert client.get("/polls/search", params={"q": 'tabs" OR "x'}).status_code == 200
+    assert client.get("/polls/search", params={"q": "?!"}).status_code == 400
+
+    first_page = client.get("/polls/search", params={"q": "python", "limit": 1})
+    cursor = first_page.headers["X-Next-Cursor"]
+    second_page = client.get(
+        "/polls/search", params={"q": "python", "limit": 1, "after": cursor}
+    )
+    assert {first_page.json()[0]["id"], second_page.json()[0]["id"]} == set(created[:2])
+    assert client.get("/polls/search?q=python&after=not-a-cursor").status_code == 400
+
+    client.delete(f"/polls/{created[2]}", headers=headers)
+    assert client.get("/polls/search", params={"q": "tabs"}).json() == []
+
+
+def test_fast_json_matches_validated_output(monkeypatch):
+    regular = client.get("/polls?limit=2")
+    regular_poll = client.get(f"/polls/{regular.json()[0]['id']}")
+    monkeypatch.setattr(serialization, "FAST_JSON", True)
+    fast = client.get("/polls?limit=2")
+    assert fast.json() == regular.json()
+    assert fast.headers["X-Next-Cursor"] == regular.headers["X-Next-Cursor"]
+    fast_poll = client.get(f"/polls/{regular.json()[0]['id']}")
+    assert fast_poll.json() == regular_poll.json()
+    assert client.get("/polls/999999").status_code == 404
+
+
+def test_metrics_endpoint():
+    def sample(text, name):
+        for line in text.splitlines():
+            if line.startswith(name + " "):
+                return float(line.rsplit(" ", 1)[1])
+        return None
+
+    route = '{method="GET",route="/polls"}'
+    before = client.get("/metrics").text
+    client.get("/polls?limit=2")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    after = response.text
+
+    count = f"polly_http_request_queries_count{route}"
+    total = f"polly_http_request_queries_sum{route}"
+    assert sample(after, count) - sample(before, count) == 1
+    # Same two statements as test_get_polls_keyset_pagination: no N+1 on options
+    assert sample(after, total) - sample(before, total) == 2
+    assert 'polly_http_requests_total{method="GET",route="/polls",status="200"}' in after
+    assert 'polly_http_requests_in_flight{method="GET",route="/metrics"} 1' in after
+    assert 'polly_http_request_duration_seconds_bucket{method="GET",route="/polls",le="+Inf"}' in after
+    assert 'polly_cache_hits_total{cache="results"}' in after
+    client.get("/polls/999999")
+    assert 'route="/polls/{poll_id}",status="404"' in client.get("/metrics").text
+
+
+def test_write_rate_limits(monkeypatch):
+    monkeypatch.setattr(ratelimit, "limiter", ratelimit.WriteRateLimiter(
+        user_rate=0.01, user_burst=2, global_rate=0
+    ))
+    headers = {"Authorization": f"Bearer {token}"}
+    body = {"question": "Rate limited?", "options": ["Yes", "No"]}
+    for _ in range(2):
+        assert client.post("/polls", json=body, headers=headers).status_code == 200
+    limited = client.post("/polls", json=body, headers=headers)
+    assert limited.status_code == 429
+    assert int(limited.headers["Retry-After"]) >= 1
+    # Reads are never limited
+    assert client.get("/polls").status_code == 200
+
+    # A different user has a bucket of their own
+    client.post("/register", json={"username": "ratelimited2", "password": "pass"})
+    other = client.post("/login", data={"username": "ratelimited2", "password": "pass"})
+    other_headers = {"Authorization": f"Bearer {other.json()['access_token']}"}
+    assert client.post("/polls", json=body, headers=other_headers).status_code == 200
+
+    monkeypatch.setattr(ratelimit, "limiter", ratelimit.WriteRateLimiter(
+        user_rate=0, global_rate=0.01, global_burst=1
+    ))
+    assert client.post("/polls", json=body, headers=headers).status_code == 200
+    assert client.post("/polls", json=body, headers=other_headers).status_code == 429
+    assert 'polly_write_rejections_total{reason="global_rate"} ' in client.get("/metrics").text
+
+
+def test_write_admission_control(monkeypatch):
+    admission = ratelimit.AdmissionController(max_in_flight=1, p99_ms=0)
+    monkeypatch.setattr(ratelimit, "admission", admission)
+    headers = {"Authorization": f"Bearer {token}"}
+    body = {"question": "Admitted?", "options": ["Yes", "No"]}
+
+    admission.enter()  # a write already holds the only slot
+    shed = client.post("/polls", json=body, headers=headers)
+    assert shed.status_code == 503
+    assert shed.headers["Retry-After"] == ratelimit.OVERLOAD_RETRY_AFTER
+    admission.exit(0.001)
+    assert client.post("/polls", json=body, headers=headers).status_code == 200
+    assert admission.in_flight == 0
+
+    slow = ratelimit.AdmissionController(
+        max_in_flight=0, p99_ms=50, window_seconds=0.2, min_samples=5, refresh_seconds=0
+    )
+    for _ in range(5):
+        slow.enter()
+        slow.exit(0.5)
+    with pytest.raises(HTTPException) as excinfo:
+        slow.enter()
+    assert excinfo.value.status_code == 503
+    # Shedding stops once the slow writes age out of the window
+    time.sleep(0.6)
+    slow.enter()
+    slow.exit(0.001)
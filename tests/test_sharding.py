@@ -0,0 +1,200 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import asyncio
+import sqlite3
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from api import async_routes, counters, sharding, votes
+from api.database import get_async_db, get_async_read_db
+from api.sharding import ShardRouter
+
+
+# Users and polls live in the main test database, options and votes in shards
+@pytest.fixture(scope="module")
+def api(make_api):
+    return make_api("sharding")
+
+
+@pytest.fixture(scope="module")
+def shards(tmp_path_factory):
+    router = ShardRouter(4, str(tmp_path_factory.mktemp("shards") / "shard-{index}.db"))
+    router.create_all()
+    return router
+
+
+@pytest.fixture(scope="module")
+def client(api, shards):
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.setattr(sharding, "shards", shards)
+    yield TestClient(api.app)
+    monkeypatch.undo()
+    for shard_engine in shards.engines:
+        shard_engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def headers(client, login):
+    return login(client, "sharduser", "shardpass")
+
+
+def _create_polls(client, headers, count):
+    return [
+        client.post(
+            "/polls",
+            json={"question": f"Shard question {n}?", "options": ["Left", "Right"]},
+            headers=headers,
+        ).json()
+        for n in range(count)
+    ]
+
+
+def _shard_rows(shards, poll_id, table):
+    path = shards.paths[shards.index(poll_id)]
+    with sqlite3.connect(path) as conn:
+        return conn.execute(f"SELECT * FROM {table} WHERE poll_id = ?", (poll_id,)).fetchall()
+
+
+def test_votes_are_written_to_the_poll_shard(api, client, headers, shards):
+    polls = _create_polls(client, headers, 8)
+    assert len({shards.index(poll["id"]) for poll in polls}) > 1
+
+    for poll in polls:
+        option_id = poll["options"][1]["id"]
+        response = client.post(
+            f"/polls/{poll['id']}/vote", json={"option_id": option_id}, headers=headers
+        )
+        assert response.status_code == 200
+        results = client.get(f"/polls/{poll['id']}/results").json()["results"]
+        assert [result["vote_count"] for result in results] == [0, 1]
+        assert len(_shard_rows(shards, poll["id"], "votes")) == 1
+        assert len(_shard_rows(shards, poll["id"], "options")) == 2
+
+    with sqlite3.connect(api.path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM votes").fetchone()[0] == 0
+
+    # Listings are still served from the main database
+    listed = client.get("/polls", params={"limit": 100}).json()
+    assert {poll["id"] for poll in polls} <= {poll["id"] for poll in listed}
+
+    for index in range(shards.count):
+        with api.session_factory(binds=shards.binds(index)) as db:
+            assert counters.verify_vote_counts(db) == []
+
+
+def test_batch_votes_span_shards(client, headers, shards):
+    polls = _create_polls(client, headers, 6)
+    items = [{"poll_id": poll["id"], "option_id": poll["options"][0]["id"]} for poll in polls]
+    items.append({"poll_id": polls[0]["id"], "option_id": polls[1]["options"][0]["id"]})
+    response = client.post("/votes/batch", json={"votes": items}, headers=headers)
+    assert response.status_code == 200
+    summary = response.json()
+    assert summary["recorded"] == 6
+    assert summary["rejected"] == 1
+    assert summary["results"][-1]["status"] == "rejected"
+
+    for poll in polls:
+        results = client.get(f"/polls/{poll['id']}/results").json()["results"]
+        assert [result["vote_count"] for result in results] == [1, 0]
+
+
+def test_group_commit_writer_routes_votes_by_shard(api, client, headers, shards):
+    polls = _create_polls(client, headers, 6)
+    writer = votes.start_writer(api.session_factory, interval_ms=1)
+    try:
+        assert isinstance(writer, votes.ShardedVoteWriter)
+        for poll in polls:
+            response = client.post(
+                f"/polls/{poll['id']}/vote",
+                json={"option_id": poll["options"][0]["id"]},
+                headers=headers,
+            )
+            assert response.status_code == 200
+    finally:
+        votes.stop_writer()
+    for poll in polls:
+        assert len(_shard_rows(shards, poll["id"], "votes")) == 1
+
+
+def test_delete_poll_removes_shard_rows(api, client, headers, shards):
+    poll = _create_polls(client, headers, 1)[0]
+    client.post(
+        f"/polls/{poll['id']}/vote",
+        json={"option_id": poll["options"][0]["id"]},
+        headers=headers,
+    )
+    assert client.delete(f"/polls/{poll['id']}", headers=headers).status_code == 204
+    assert client.get(f"/polls/{poll['id']}/results").status_code == 404
+    assert _shard_rows(shards, poll["id"], "votes") == []
+    assert _shard_rows(shards, poll["id"], "options") == []
+    with sqlite3.connect(api.path) as conn:
+        assert conn.execute(
+            "SELECT COUNT(*) FROM options WHERE poll_id = ?", (poll["id"],)
+        ).fetchone()[0] == 0
+
+
+def test_repair_copies_options_a_failed_create_left_out(api, client, headers, shards):
+    poll = _create_polls(client, headers, 1)[0]
+    path = shards.paths[shards.index(poll["id"])]
+    with sqlite3.connect(path) as conn:
+        conn.execute("DELETE FROM options WHERE poll_id = ?", (poll["id"],))
+    vote = {"option_id": poll["options"][0]["id"]}
+    assert client.post(f"/polls/{poll['id']}/vote", json=vote, headers=headers).status_code == 404
+
+    with api.session_factory() as db:
+        assert sharding.repair_options(db) == 2
+        assert sharding.repair_options(db) == 0
+    assert client.post(f"/polls/{poll['id']}/vote", json=vote, headers=headers).status_code == 200
+
+
+def test_async_routes_use_async_shard_engines(api, client, shards):
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{api.path}")
+    AsyncTestingSessionLocal = async_sessionmaker(
+        bind=async_engine, autoflush=False, expire_on_commit=False
+    )
+
+    async def override_get_async_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
+
+    async_app = FastAPI()
+    async_app.include_router(async_routes.router)
+    async_app.dependency_overrides[get_async_db] = override_get_async_db
+    async_app.dependency_overrides[get_async_read_db] = override_get_async_db
+
+    # Shard statements must go through aiosqlite, never the blocking engines
+    blocking, non_blocking = [], []
+    spies = [
+        (engine, lambda *args: blocking.append(args[2])) for engine in shards.engines
+    ] + [
+        (engine.sync_engine, lambda *args: non_blocking.append(args[2]))
+        for engine in shards.async_engines
+    ]
+    for engine, spy in spies:
+        event.listen(engine, "before_cursor_execute", spy)
+    try:
+        with TestClient(async_app) as async_client:
+            async_client.post("/register", json={"username": "asyncshard", "password": "pw"})
+            token = async_client.post(
+                "/login", data={"username": "asyncshard", "password": "pw"}
+            ).json()["access_token"]
+            async_headers = {"Authorization": f"Bearer {token}"}
+            polls = _create_polls(async_client, async_headers, 4)
+            items = [
+                {"poll_id": poll["id"], "option_id": poll["options"][1]["id"]} for poll in polls
+            ]
+            batch = async_client.post("/votes/batch", json={"votes": items}, headers=async_headers)
+            assert batch.json()["recorded"] == 4
+            ids = ",".join(str(poll["id"]) for poll in polls)
+            found = async_client.get("/polls/results", params={"ids": ids}).json()["results"]
+            assert [[r["vote_count"] for r in poll["results"]] for poll in found] == [[0, 1]] * 4
+    finally:
+        for engine, spy in spies:
+            event.remove(engine, "before_cursor_execute", spy)
+        asyncio.run(async_engine.dispose())
+    assert blocking == []
+    assert any(statement.startswith("INSERT INTO votes") for statement in non_blocking)
@@ -0,0 +1,68 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import json
+import sqlite3
+import subprocess
+import pytest
+from api import migrations
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Importing main in a fresh interpreter must stay within this many seconds
+IMPORT_BUDGET_SECONDS = float(os.getenv("POLLY_IMPORT_BUDGET_SECONDS", "2.0"))
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "seconds": elapsed,
+    "modules": sorted(m for m in ("passlib", "jose", "dotenv") if m in sys.modules),
+}))
+"""
+
+
+def _run(code, database_path, **env):
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        env={**os.environ, "POLLY_DATABASE_PATH": database_path, **env},
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def test_import_is_fast_and_side_effect_free(tmp_path):
+    database_path = str(tmp_path / "startup.db")
+    # The first run warms the bytecode cache; time the second one
+    _run(PROBE, database_path)
+    probe = json.loads(_run(PROBE, database_path).splitlines()[-1])
+
+    assert not os.path.exists(database_path)
+    assert probe["modules"] == []
+    assert probe["seconds"] < IMPORT_BUDGET_SECONDS, probe
+
+
+def test_startup_creates_schema_once(tmp_path):
+    database_path = str(tmp_path / "startup.db")
+    start = "from fastapi.testclient import TestClient\nimport main\n" \
+            "with TestClient(main.app) as client:\n    client.get('/polls')\n"
+    _run(start, database_path)
+    with sqlite3.connect(database_path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == migrations.SCHEMA_VERSION
+
+
+def test_outdated_schema_fails_startup_without_auto_migrate(tmp_path):
+    database_path = str(tmp_path / "legacy.db")
+    with sqlite3.connect(database_path) as conn:
+        conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY)")
+    start = "from fastapi.testclient import TestClient\nimport main\n" \
+            "with TestClient(main.app):\n    pass\n"
+    with pytest.raises(AssertionError, match="manage.py migrate"):
+        _run(start, database_path, POLLY_AUTO_MIGRATE="0")